@@ -1,9 +1,197 @@
 import streamlit as st
 import random
 import base64
+import functools
+import hashlib
+import io
 import json
-from typing import List, Dict, Any
+import logging
+import math
+import os
+import re
+import struct
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
 import streamlit.components.v1 as components
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from PIL import Image, ImageOps
+
+# Longest-edge sizes (device px) of the renditions produced at upload time.
+# Cards are shown at 80–400 CSS px; with _DEVICE_PIXEL_RATIO the largest
+# rendition still covers the biggest card on a HiDPI screen.
+_RENDITION_SIZES = (128, 256, 512, 800)
+_RENDITION_FORMAT = "WEBP"
+_RENDITION_MIME = "image/webp"
+_RENDITION_QUALITY = 80
+_DEVICE_PIXEL_RATIO = 2
+
+# Uploads above these limits are rejected before they are decoded. Within
+# them, JPEGs are decoded at a reduced scale (draft mode) close to the
+# largest rendition, so a huge source is never materialized at full size.
+_MAX_UPLOAD_BYTES = int(os.environ.get("MEMORY_MAX_UPLOAD_MB", "50")) * 1024 * 1024
+_MAX_IMAGE_PIXELS = int(os.environ.get("MEMORY_MAX_IMAGE_MP", "50")) * 1_000_000
+_HASH_CHUNK_BYTES = 1024 * 1024
+
+# The pairing view pages its grids and shows images at most this wide.
+_THUMB_PX = 120
+_PAGE_SIZES = [12, 24, 48, 96]
+
+# Auto-pairing: difference hashes (64 bit) farther apart than this are never
+# proposed as a pair by default.
+_AUTO_PAIR_MAX_DISTANCE = 10
+# Uploads whose dHashes are at most this far apart are flagged as duplicates.
+_NEAR_DUPLICATE_DISTANCE = 4
+
+# Shared image store: blobs live on disk under _BLOB_DIR, hot ones are also
+# kept in an in-memory LRU of at most _BLOB_CACHE_BYTES.
+_BLOB_DIR = os.environ.get("MEMORY_BLOB_DIR") or os.path.join(tempfile.gettempdir(), "memory_demo_blobs")
+_BLOB_CACHE_BYTES = int(os.environ.get("MEMORY_BLOB_CACHE_MB", "256")) * 1024 * 1024
+# Published decks are small manifests next to the blobs they reference, so
+# every session that opens one shares the same stored images.
+_LIBRARY_DIR = os.environ.get("MEMORY_LIBRARY_DIR") or os.path.join(_BLOB_DIR, "decks")
+# Budgets for stored image bytes (renditions and back image), per session and
+# over all live sessions. Uploads beyond a budget are rejected; sessions idle
+# for _SESSION_IDLE_SECONDS count as abandoned and their images are deleted.
+_SESSION_BUDGET_BYTES = int(os.environ.get("MEMORY_SESSION_BUDGET_MB", "100")) * 1024 * 1024
+_GLOBAL_BUDGET_BYTES = int(os.environ.get("MEMORY_GLOBAL_BUDGET_MB", "2048")) * 1024 * 1024
+_SESSION_IDLE_SECONDS = int(os.environ.get("MEMORY_SESSION_IDLE_MIN", "60")) * 60
+_BUDGET_WARN_RATIO = 0.8
+# Upper estimate of the stored renditions of one upload (~0.5 byte per pixel)
+_RENDITION_ESTIMATE_BYTES = sum(edge * edge for edge in _RENDITION_SIZES) // 2
+
+# Uploads are decoded/transcoded on a process-wide thread pool (Pillow
+# releases the GIL while decoding, resizing and encoding).
+_INGEST_WORKERS = int(os.environ.get("MEMORY_INGEST_WORKERS", "0")) or (os.cpu_count() or 2)
+
+# How the game board gets its images: "inline" embeds data URIs, "url" has
+# the browser fetch them from a small endpoint under immutable hash URLs so
+# they stay cached across reruns and reshuffles. Behind a proxy or HTTPS,
+# set MEMORY_IMAGE_BASE_URL to the public address of that endpoint.
+_IMAGE_DELIVERY = os.environ.get("MEMORY_IMAGE_DELIVERY", "inline")
+_IMAGE_SERVER_HOST = os.environ.get("MEMORY_IMAGE_HOST", "0.0.0.0")
+_IMAGE_SERVER_PORT = int(os.environ.get("MEMORY_IMAGE_PORT", "8502"))
+_IMAGE_BASE_URL = os.environ.get("MEMORY_IMAGE_BASE_URL", "")
+
+# The play board and the pairing board are bidirectional components served
+# from frontend/. MEMORY_COMPONENTS=0 falls back to a standalone
+# components.html board and the per-click pairing flow (for hosts that block
+# component assets).
+_FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "frontend")
+_BOARD_DIR = os.path.join(_FRONTEND_DIR, "board")
+_USE_COMPONENTS = os.environ.get("MEMORY_COMPONENTS", "1") != "0"
+
+_memory_board = components.declare_component("memory_board", path=_BOARD_DIR)
+_pairing_board = components.declare_component("pairing_board", path=os.path.join(_FRONTEND_DIR, "pairing"))
+
+# MEMORY_DEBUG=1 times the stage functions per rerun, shows the numbers in a
+# sidebar panel and logs one JSON line per rerun to the "memory_demo" logger.
+# Off, the instrumentation is not even wrapped around anything.
+_DEBUG = os.environ.get("MEMORY_DEBUG", "0") == "1"
+_log = logging.getLogger("memory_demo")
+
+# The board's console output (silent|error|warn|info|debug). With
+# MEMORY_CLIENT_PERF=1 the board also reports time-to-interactive, image
+# decode times and long tasks; reports are logged to "memory_demo", as one
+# JSON line each on stderr (see the handler below).
+_CLIENT_LOG_LEVEL = os.environ.get("MEMORY_CLIENT_LOG_LEVEL", "silent")
+_CLIENT_PERF_REPORT = os.environ.get("MEMORY_CLIENT_PERF", "0") == "1"
+
+# Streamlit only sets up its own loggers, so "memory_demo" gets a stderr
+# handler of its own once there is something to log (MEMORY_LOG_LEVEL,
+# default INFO). The script runs again on every rerun: add it only once.
+if (_DEBUG or _CLIENT_PERF_REPORT) and not _log.handlers:
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    _log.addHandler(_log_handler)
+    _log.setLevel(os.environ.get("MEMORY_LOG_LEVEL", "INFO").upper())
+    _log.propagate = False
+
+
+# --------------- Instrumentation ---------------
+
+def _timed(fn):
+    '''Add fn's wall time and call count to the rerun's metrics (only with _DEBUG).'''
+    if not _DEBUG:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            # Background threads (ingestion, pre-building) have no session
+            perf = st.session_state.get("perf") if get_script_run_ctx() else None
+            if perf is not None:
+                calls, seconds = perf["timings"].get(fn.__name__, (0, 0.0))
+                perf["timings"][fn.__name__] = (calls + 1, seconds + time.perf_counter() - t0)
+
+    return wrapper
+
+
+def _perf_count(name: str, amount: int = 1):
+    '''Bump a counter of the rerun's metrics; callers check _DEBUG first.'''
+    perf = st.session_state.get("perf") if get_script_run_ctx() else None
+    if perf is not None:
+        perf["counters"][name] = perf["counters"].get(name, 0) + amount
+
+
+def _deep_sizeof(obj, seen=None) -> int:
+    '''Approximate bytes held by obj and everything it references.'''
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_sizeof(item, seen) for item in obj)
+    return size
+
+
+def _perf_finish(started: float, stage: str) -> Dict[str, Any]:
+    '''Close the rerun's metrics and emit them as one structured log line.'''
+    ss = st.session_state
+    perf = ss.perf
+    record = {
+        "session": ss.perf_session,
+        "stage": stage,
+        "rerun_ms": round((time.perf_counter() - started) * 1000, 2),
+        "session_bytes": _deep_sizeof({k: v for k, v in ss.items() if k != "perf"}),
+        "timings_ms": {name: round(seconds * 1000, 2) for name, (_, seconds) in perf["timings"].items()},
+        "calls": {name: calls for name, (calls, _) in perf["timings"].items()},
+        **perf["counters"],
+    }
+    _log.info(json.dumps(record))
+    return record
+
+
+def _debug_panel(record: Dict[str, Any]):
+    '''Sidebar panel with the metrics of the rerun that just ran.'''
+    with st.sidebar.expander("🔧 Debug: Performance", expanded=False):
+        st.caption(f"Sitzung {record['session']} · Stufe {record['stage']}")
+        st.metric("Rerun", f"{record['rerun_ms']:.0f} ms")
+        st.metric("Sitzungsdaten", f"{record['session_bytes'] / 1024:.0f} KiB")
+        if "payload_bytes" in record:
+            st.metric("Board-Payload", f"{record['payload_bytes'] / 1024:.0f} KiB")
+        if "images" in record:
+            st.metric("Bilder gerendert", record["images"])
+        st.table([
+            {"Funktion": name, "Aufrufe": record["calls"][name], "ms": ms}
+            for name, ms in sorted(record["timings_ms"].items(), key=lambda item: -item[1])
+        ])
+
+
 
 # --------------- Utilities ---------------
 
@@ -18,19 +206,38 @@ def _rerun():
 def _init_state():
     ss = st.session_state
     ss.setdefault("stage", "setup")  # "setup" | "pair" | "play" | "win"
-    ss.setdefault("back_img", None)  # bytes
-    ss.setdefault("faces", [])       # list of dicts: {id, name, bytes}
+    ss.setdefault("back_img", None)  # renditions: {edge: blob hash}
+    ss.setdefault("faces", [])       # list of dicts: {id, name, hash, renditions}
+    ss.setdefault("ingested", {})    # upload key -> face id (None if unreadable)
+    ss.setdefault("collapsed", {})   # upload key -> face id it was merged into
+    ss.setdefault("dup_ignored", set())  # frozensets of face ids kept apart on purpose
+    ss.setdefault("next_face_id", 0)
+    ss.setdefault("back_key", None)  # upload key of the current back image
+    ss.setdefault("deck_key", None)  # upload key of the last loaded deck file
     ss.setdefault("unpaired_ids", set())  # Set[int]
     ss.setdefault("pair_bucket", [])      # List[int] (0..2)
     ss.setdefault("pairs", [])            # List[List[int]] -> [[id1, id2], ...]
-    ss.setdefault("deck", [])             # List[Dict]
+    ss.setdefault("applied_batch", None)  # Last pairing-board batch applied
+    ss.setdefault("deck", None)           # {seed, pos, pair_idx, face_id}: int32 arrays in play order
+    ss.setdefault("deck_id", None)        # Changes on every shuffle
     ss.setdefault("revealed", [])         # List[int] (card positions)
     ss.setdefault("mismatch_pending", False)
     ss.setdefault("cols", 4)
     ss.setdefault("size_px", 160)
     ss.setdefault("card_spacing", 10)     # Added: spacing between cards
     ss.setdefault("game_won", False)      # Track win state
+    ss.setdefault("game_stats", _new_game_stats())  # totals reported by the board
+    ss.setdefault("board_sent", set())    # image digests the mounted board component holds
+    ss.setdefault("board_ack", {"mount": None, "seq": 0})  # last board report handled
+    ss.setdefault("board_document", None) # (key, html) of the last standalone board
     ss.setdefault("container_scale", 100) # Container scale percentage
+    ss.setdefault("page_size", 24)        # Pairing view: images/pairs per page
+    ss.setdefault("unpaired_page", 0)
+    ss.setdefault("pairs_page", 0)
+    ss.setdefault("auto_proposals", [])   # List[[id1, id2]] awaiting review
+    ss.setdefault("auto_rejected", set()) # Indices into auto_proposals
+    ss.setdefault("auto_round", 0)        # Bumped per computation; keys the review checkboxes
+    ss.setdefault("auto_page", 0)
 
 
 def _chunk(lst: List[Any], n: int) -> List[List[Any]]:
@@ -38,18 +245,877 @@ def _chunk(lst: List[Any], n: int) -> List[List[Any]]:
     return [lst[i:i+n] for i in range(0, len(lst), n)]
 
 
+def _turn_page(page_key: str, step: int):
+    st.session_state[page_key] += step
+
+
+def _paginate(items: List[Any], page_key: str) -> Tuple[int, List[Any]]:
+    '''Render prev/next controls and return (offset, items on the current page).'''
+    page_size = st.session_state.page_size
+    pages = max(1, math.ceil(len(items) / page_size))
+    # Clicks are applied in callbacks, before this run, so the buttons'
+    # disabled state matches the page shown
+    page = max(0, min(st.session_state[page_key], pages - 1))
+    st.session_state[page_key] = page
+    if pages > 1:
+        prev_col, info_col, next_col = st.columns([1, 2, 1])
+        prev_col.button("◀️", key=f"{page_key}_prev", disabled=page == 0, on_click=_turn_page, args=(page_key, -1))
+        next_col.button("▶️", key=f"{page_key}_next", disabled=page == pages - 1, on_click=_turn_page, args=(page_key, 1))
+        info_col.caption(f"Seite {page + 1} von {pages}")
+    offset = page * page_size
+    return offset, items[offset:offset + page_size]
+
+
 def _face_lookup() -> Dict[int, Dict[str, Any]]:
     '''Return face dict by id for quick lookup.'''
     return {f["id"]: f for f in st.session_state.faces}
 
 
-def _image_to_base64(image_bytes):
-    """Convert image bytes to base64 string for embedding."""
-    return base64.b64encode(image_bytes).decode()
+_DIGEST_RE = re.compile(r"[0-9a-f]{40}")
+
+
+def _content_hash(data: bytes) -> str:
+    '''Stable content hash used to key blobs and cached encodings.'''
+    return hashlib.sha1(data).hexdigest()
+
+
+def _stream_hash(fh) -> str:
+    '''_content_hash of a seekable file, read in chunks; leaves it rewound.'''
+    h = hashlib.sha1()
+    fh.seek(0)
+    while chunk := fh.read(_HASH_CHUNK_BYTES):
+        h.update(chunk)
+    fh.seek(0)
+    return h.hexdigest()
+
+
+# Keyed by blob hash, so identical images share one encoding across reruns
+# and sessions. cache_resource hands back the same str object every time.
+@_timed
+@st.cache_resource(max_entries=1024, show_spinner=False)
+def _image_to_base64(digest: str) -> str:
+    """Convert a stored image to base64 string for embedding (cached by content hash)."""
+    return base64.b64encode(_load_image(digest)).decode()
+
+
+def _image_to_data_uri(digest: str) -> str:
+    return f"data:{_RENDITION_MIME};base64," + _image_to_base64(digest)
+
+
+# --------------- Blob Store ---------------
+
+class BlobStore:
+    '''Content-addressed byte store shared by all sessions.
+
+    Blobs are written once to ``root`` under their hash; reads go through an
+    in-memory LRU bounded by ``cache_bytes``, falling back to disk.
+    '''
+
+    def __init__(self, root: str, cache_bytes: int):
+        self.root = root
+        self.cache_bytes = cache_bytes
+        self._lru: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lru_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, digest: str) -> str:
+        # Hashes come from session state and deck files; never let one name
+        # a path outside the store
+        if not isinstance(digest, str) or not _DIGEST_RE.fullmatch(digest):
+            raise ValueError(f"invalid blob hash {digest!r}")
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _remember(self, digest: str, data: bytes):
+        with self._lock:
+            if digest in self._lru:
+                self._lru.move_to_end(digest)
+                return
+            self._lru[digest] = data
+            self._lru_bytes += len(data)
+            while self._lru_bytes > self.cache_bytes and len(self._lru) > 1:
+                _, old = self._lru.popitem(last=False)
+                self._lru_bytes -= len(old)
+
+    def put(self, data: bytes, cache: bool = True) -> str:
+        '''Store data (idempotent) and return its hash.
+
+        ``data`` may be any buffer (e.g. a memoryview into an upload); pass
+        ``cache=False`` to write it through without keeping a reference.
+        '''
+        digest = _content_hash(data)
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp, path)
+        if cache:
+            self._remember(digest, data)
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        with self._lock:
+            data = self._lru.get(digest)
+            if data is not None:
+                self._lru.move_to_end(digest)
+                return data
+        with open(self._path(digest), "rb") as fh:
+            data = fh.read()
+        self._remember(digest, data)
+        return data
+
+    def __contains__(self, digest: str) -> bool:
+        if not isinstance(digest, str) or not _DIGEST_RE.fullmatch(digest):
+            return False
+        return digest in self._lru or os.path.exists(self._path(digest))
+
+    def size(self, digest: str) -> int:
+        try:
+            return os.path.getsize(self._path(digest))
+        except FileNotFoundError:
+            return 0
+
+    def discard(self, digest: str):
+        '''Drop a blob from memory and disk.'''
+        with self._lock:
+            data = self._lru.pop(digest, None)
+            if data is not None:
+                self._lru_bytes -= len(data)
+        try:
+            os.remove(self._path(digest))
+        except FileNotFoundError:
+            pass
+
+
+@st.cache_resource(show_spinner=False)
+def _blob_store() -> BlobStore:
+    return BlobStore(_BLOB_DIR, _BLOB_CACHE_BYTES)
+
+
+def _load_image(digest: str) -> bytes:
+    return _blob_store().get(digest)
+
+
+class MemoryLedger:
+    '''Which blobs each live session references, for budgets and eviction.
+
+    Blobs are shared, so the global total counts each blob once. Cold blobs
+    already fall out of the store's in-memory LRU onto disk; the ledger
+    deletes the blobs of abandoned sessions that nobody else references.
+    '''
+
+    def __init__(self, store: BlobStore, session_budget: int, global_budget: int, idle_seconds: float):
+        self.store = store
+        self.session_budget = session_budget
+        self.global_budget = global_budget
+        self.idle_seconds = idle_seconds
+        self._sessions: Dict[str, Tuple[float, frozenset]] = {}
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _bytes(self, digests) -> int:
+        for digest in digests:
+            if digest not in self._sizes:
+                self._sizes[digest] = self.store.size(digest)
+        return sum(self._sizes[d] for d in digests)
+
+    def touch(self, session: str, digests) -> bool:
+        '''Record a session's current blobs; False if the session was unknown.'''
+        with self._lock:
+            known = session in self._sessions
+            self._sessions[session] = (time.monotonic(), frozenset(digests))
+            return known
+
+    def usage(self, session: str) -> Tuple[int, int]:
+        '''(bytes referenced by the session, bytes referenced by all sessions).'''
+        with self._lock:
+            mine = self._sessions.get(session, (0, frozenset()))[1]
+            everyone = frozenset().union(*(d for _, d in self._sessions.values()))
+            return self._bytes(mine), self._bytes(everyone)
+
+    def headroom(self, session: str) -> int:
+        '''Bytes the session may still add without breaking either budget.'''
+        mine, everyone = self.usage(session)
+        return min(self.session_budget - mine, self.global_budget - everyone)
+
+    def evict_idle(self, pinned=frozenset) -> int:
+        '''Forget sessions idle too long and delete blobs only they used.
+
+        ``pinned`` returns digests that must survive (e.g. published decks);
+        it is only called when there is something to evict.
+        '''
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._lock:
+            idle = [s for s, (seen, _) in self._sessions.items() if seen < cutoff]
+            if not idle:
+                return 0
+            dropped = frozenset().union(*(self._sessions.pop(s)[1] for s in idle))
+            live = frozenset().union(*(d for _, d in self._sessions.values()))
+            orphans = dropped - live - pinned()
+            for digest in orphans:
+                self._sizes.pop(digest, None)
+        for digest in orphans:
+            self.store.discard(digest)
+        return len(idle)
+
+
+@st.cache_resource(show_spinner=False)
+def _memory_ledger() -> MemoryLedger:
+    return MemoryLedger(_blob_store(), _SESSION_BUDGET_BYTES, _GLOBAL_BUDGET_BYTES, _SESSION_IDLE_SECONDS)
+
+
+def _fits_budget(upload) -> bool:
+    '''Whether ingesting this upload stays within the session and global budgets.'''
+    return min(upload.size, _RENDITION_ESTIMATE_BYTES) <= _memory_ledger().headroom(st.session_state.ledger_id)
+
+
+def _budget_notice():
+    '''Warn before uploads start being rejected.'''
+    ledger = _memory_ledger()
+    mine, everyone = ledger.usage(st.session_state.ledger_id)
+    mb = 1024 * 1024
+    if mine >= _BUDGET_WARN_RATIO * ledger.session_budget:
+        st.warning(
+            f"Deine Bilder belegen {mine / mb:.0f} von {ledger.session_budget / mb:.0f} MB. "
+            "Weitere Uploads werden abgelehnt, sobald das Kontingent erschöpft ist."
+        )
+    elif everyone >= _BUDGET_WARN_RATIO * ledger.global_budget:
+        st.warning("Der Server ist fast voll; neue Uploads werden eventuell abgelehnt.")
+
+
+def _session_digests() -> List[str]:
+    ss = st.session_state
+    digests = list((ss.back_img or {}).values())
+    for face in ss.faces:
+        digests.extend(face["renditions"].values())
+    return digests
+
+
+def _account_session():
+    '''Register this session's blobs with the ledger and evict abandoned sessions.
+
+    A session that was itself evicted while idle comes back without its
+    images; it is sent back to an empty setup page.
+    '''
+    ss = st.session_state
+    ss.setdefault("ledger_id", f"{random.getrandbits(64):016x}")
+    ledger = _memory_ledger()
+    ledger.evict_idle(pinned=_library_digests)
+    digests = _session_digests()
+    if not ledger.touch(ss.ledger_id, digests) and not all(d in ledger.store for d in digests):
+        ss.back_img, ss.back_key = None, None
+        ss.faces, ss.ingested, ss.collapsed = [], {}, {}
+        ss.pairs, ss.unpaired_ids, ss.pair_bucket = [], set(), []
+        ss.deck = None
+        ss.stage = "setup"
+        ledger.touch(ss.ledger_id, [])
+        st.warning("Deine Sitzung war zu lange inaktiv; ihre Bilder wurden entfernt. Bitte lade sie erneut hoch.")
+
+
+# --------------- Image Server ---------------
+
+_BLOB_URL_RE = re.compile(r"/img/([0-9a-f]{40})\.webp")
+
+
+class _BlobRequestHandler(BaseHTTPRequestHandler):
+    '''Serve blob store entries as immutable, long-lived cacheable images.'''
+
+    def do_GET(self):
+        match = _BLOB_URL_RE.fullmatch(self.path.split("?", 1)[0])
+        store = self.server.store
+        if match is None or match.group(1) not in store:
+            self.send_error(404)
+            return
+        digest = match.group(1)
+        etag = f'"{digest}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self._send_cache_headers(etag)
+            self.end_headers()
+            return
+        data = store.get(digest)
+        self.send_response(200)
+        self.send_header("Content-Type", _RENDITION_MIME)
+        self.send_header("Content-Length", str(len(data)))
+        self._send_cache_headers(etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_cache_headers(self, etag: str):
+        # Content-addressed: a URL's bytes never change.
+        self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+        self.send_header("ETag", etag)
+        self.send_header("Access-Control-Allow-Origin", "*")
+
+    def log_message(self, format, *args):
+        pass
+
+
+@st.cache_resource(show_spinner=False)
+def _image_server() -> ThreadingHTTPServer:
+    '''Start the image endpoint once per process.'''
+    server = ThreadingHTTPServer((_IMAGE_SERVER_HOST, _IMAGE_SERVER_PORT), _BlobRequestHandler)
+    server.daemon_threads = True
+    server.store = _blob_store()
+    threading.Thread(target=server.serve_forever, name="memory-image-server", daemon=True).start()
+    return server
+
+
+def _image_delivery() -> str:
+    '''Return the effective delivery mode, falling back to inline if the endpoint can't start.'''
+    if _IMAGE_DELIVERY != "url":
+        return "inline"
+    try:
+        _image_server()
+    except OSError:
+        return "inline"
+    return "url"
+
+
+def _image_src(digest: str, delivery: str) -> str:
+    '''Image reference for the game board: a data URI, a path on the image endpoint
+    or (delivery "ref") a "#<digest>" key into the board component's image cache.'''
+    if _DEBUG:
+        _perf_count("images")
+    if delivery == "url":
+        return f"/img/{digest}.webp"
+    if delivery == "ref":
+        return f"#{digest}"
+    return _image_to_data_uri(digest)
+
+
+# --------------- Image Ingestion ---------------
+
+def _make_renditions(fh) -> Dict[int, bytes]:
+    '''Decode an upload once and return WebP renditions keyed by longest edge.
+
+    Renditions are never upscaled: the first size that reaches the source's
+    own longest edge is stored at native resolution and ends the ladder.
+    Only the first frame of multi-frame images is decoded, and it is
+    shrunk to the largest rendition before anything else, so an upload
+    holds one full-size decode at most (for JPEG not even that). Raises
+    ValueError for images above _MAX_IMAGE_PIXELS (checked from the header).
+    '''
+    fh.seek(0)
+    with Image.open(fh) as src:
+        if src.width * src.height > _MAX_IMAGE_PIXELS:
+            raise ValueError(f"{src.width}x{src.height} exceeds the pixel limit")
+        edge = max(_RENDITION_SIZES)
+        src.draft(src.mode, (edge, edge))  # JPEG only: decode at reduced scale
+        im = src
+        if im.mode in ("1", "P"):
+            # Palette images would only resample with NEAREST; expand them first
+            im = im.convert("RGBA" if "transparency" in im.info else "RGB")
+        # Shrink to the largest rendition right after decoding, so rotation,
+        # conversion and the ladder below never touch the full-size image
+        im.thumbnail((edge, edge), Image.LANCZOS)
+        im = ImageOps.exif_transpose(im)
+        has_alpha = "A" in im.getbands() or "transparency" in im.info
+        im = im.convert("RGBA" if has_alpha else "RGB")
+    longest = max(im.size)
+    renditions = {}
+    for edge in _RENDITION_SIZES:
+        scaled = im.copy()
+        scaled.thumbnail((edge, edge), Image.LANCZOS)
+        buf = io.BytesIO()
+        scaled.save(buf, _RENDITION_FORMAT, quality=_RENDITION_QUALITY, method=4)
+        renditions[edge] = buf.getvalue()
+        if edge >= longest:
+            break
+    return renditions
+
+
+@st.cache_resource(max_entries=4096, show_spinner=False)
+def _renditions_by_hash(digest: str, _fh) -> Dict[int, str]:
+    # Re-uploads of the same file (including the per-rerun re-read of the
+    # uploader) hit this cache instead of decoding again. Only hashes are
+    # cached here; the bytes live in the blob store.
+    store = _blob_store()
+    return {edge: store.put(blob) for edge, blob in _make_renditions(_fh).items()}
+
+
+def _ingest_image(source) -> Tuple[str, Optional[Dict[int, str]]]:
+    '''Return (content hash, renditions); renditions is None if undecodable.
+
+    ``source`` is bytes or a seekable binary file (e.g. an UploadedFile),
+    which is hashed and decoded in place rather than read into a copy.
+    '''
+    fh = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+    digest = _stream_hash(fh)
+    try:
+        renditions = _renditions_by_hash(digest, fh)
+        store = _blob_store()
+        if not all(d in store for d in renditions.values()):
+            # Evicted with an abandoned session since this was cached
+            renditions = {edge: store.put(blob) for edge, blob in _make_renditions(fh).items()}
+    except Exception:
+        return digest, None
+    return digest, renditions
+
+
+def _pick_rendition(renditions: Dict[int, str], px: int) -> str:
+    '''Return the hash of the smallest rendition that fills px CSS pixels.'''
+    need = px * _DEVICE_PIXEL_RATIO
+    for edge in sorted(renditions):
+        if edge >= need:
+            return renditions[edge]
+    return renditions[max(renditions)]
+
+
+def _face_image(face: Dict[str, Any], px: int) -> bytes:
+    if _DEBUG:
+        _perf_count("images")
+    return _load_image(_pick_rendition(face["renditions"], px))
+
+
+def _upload_limits() -> str:
+    return f"max. {_MAX_UPLOAD_BYTES // (1024 * 1024)} MB, {_MAX_IMAGE_PIXELS // 1_000_000} Megapixel"
+
+
+def _upload_key(f) -> str:
+    '''Identity of an uploaded file that is stable across reruns.'''
+    return getattr(f, "file_id", None) or f"{f.name}:{f.size}"
+
+
+@st.cache_resource(show_spinner=False)
+def _ingest_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=_INGEST_WORKERS, thread_name_prefix="memory-ingest")
+
+
+def _read_and_ingest(f) -> Tuple[Optional[str], Optional[Dict[int, str]]]:
+    if f.size > _MAX_UPLOAD_BYTES:
+        return None, None
+    try:
+        return _ingest_image(f)
+    except Exception:
+        return None, None
+
+
+def _sync_faces(face_files, on_face=None, on_failed=None):
+    '''Bring st.session_state.faces in line with the uploader, incrementally.
+
+    Only uploads not seen on an earlier rerun are read and ingested, in
+    parallel on the ingestion pool. A new upload whose content matches an
+    existing face keeps that face's id, and removed uploads only drop their
+    own face. Uploads merged into another face (see _collapse_faces) are
+    skipped while that face is still uploaded. ``on_face(index, face)`` /
+    ``on_failed(index, name)`` are called as each upload resolves, so
+    callers can show results while the rest are still processing.
+
+    New uploads that would exceed the memory budget are not ingested; their
+    names are returned, and they are retried on later reruns.
+    '''
+    ss = st.session_state
+    previous = {f["id"]: f for f in ss.faces}
+    by_hash = {f["hash"]: f["id"] for f in ss.faces}
+    resolved: List[Optional[int]] = [None] * len(face_files)
+    futures = {}
+    merged = []
+    collapsed = {}
+    rejected = set()
+    headroom = _memory_ledger().headroom(ss.ledger_id)
+
+    def submit(i, f):
+        nonlocal headroom
+        cost = min(f.size, _RENDITION_ESTIMATE_BYTES)
+        if cost > headroom:
+            rejected.add(i)
+        else:
+            headroom -= cost
+            futures[_ingest_pool().submit(_read_and_ingest, f)] = i
+
+    def report(i):
+        if i in collapsed:
+            return
+        if resolved[i] is None:
+            if on_failed:
+                on_failed(i, face_files[i].name)
+        elif on_face:
+            on_face(i, previous[resolved[i]])
+
+    # Known uploads first, so they keep their faces before new ones claim hashes
+    for i, f in enumerate(face_files):
+        key = _upload_key(f)
+        if key in ss.collapsed:
+            merged.append((i, f, key))
+        elif key in ss.ingested and (ss.ingested[key] is None or ss.ingested[key] in previous):
+            resolved[i] = ss.ingested[key]
+            if resolved[i] is not None:
+                by_hash.pop(previous[resolved[i]]["hash"], None)
+            report(i)
+        else:
+            submit(i, f)
+    present = set(resolved)
+    for i, f, key in merged:
+        if ss.collapsed[key] in present:
+            collapsed[i] = ss.collapsed[key]
+        else:
+            submit(i, f)
+
+    progress = st.progress(0.0, text="Bilder werden verarbeitet …") if futures else None
+    for done, future in enumerate(as_completed(futures), 1):
+        i = futures[future]
+        digest, renditions = future.result()
+        if renditions is None:
+            face_id = None
+        elif digest in by_hash:
+            face_id = by_hash.pop(digest)
+        else:
+            face_id = ss.next_face_id
+            ss.next_face_id += 1
+            previous[face_id] = {"id": face_id, "name": face_files[i].name, "hash": digest, "renditions": renditions}
+        resolved[i] = face_id
+        report(i)
+        progress.progress(done / len(futures), text=f"{done}/{len(futures)} Bilder verarbeitet")
+    if progress is not None:
+        progress.empty()
+
+    ss.ingested = {
+        _upload_key(f): resolved[i] for i, f in enumerate(face_files) if i not in collapsed and i not in rejected
+    }
+    ss.collapsed = {_upload_key(face_files[i]): face_id for i, face_id in collapsed.items()}
+    ss.faces = [previous[face_id] for face_id in resolved if face_id is not None]
+    _memory_ledger().touch(ss.ledger_id, _session_digests())
+    return [face_files[i].name for i in sorted(rejected)]
+
+
+def _duplicate_groups(faces: List[Dict[str, Any]]) -> List[List[int]]:
+    '''Group faces that are exact (same content hash) or near duplicates (close dHash).'''
+    if len(faces) < 2:
+        return []
+    parent = list(range(len(faces)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    first_by_hash: Dict[str, int] = {}
+    for i, face in enumerate(faces):
+        j = first_by_hash.setdefault(face["hash"], i)
+        parent[find(i)] = find(j)
+    nn_idx, nn_dist = _hamming_neighbours(_dhash_batch(faces), k=4)
+    for i, j in zip(*np.nonzero(nn_dist <= _NEAR_DUPLICATE_DISTANCE)):
+        parent[find(i)] = find(int(nn_idx[i, j]))
+
+    groups: Dict[int, List[int]] = {}
+    for i, face in enumerate(faces):
+        groups.setdefault(find(i), []).append(face["id"])
+    return [g for g in groups.values() if len(g) > 1 and frozenset(g) not in st.session_state.dup_ignored]
+
+
+def _collapse_faces(group: List[int]):
+    '''Keep the first face of a duplicate group and merge the others into it.'''
+    ss = st.session_state
+    keep, drop = group[0], set(group[1:])
+    ss.faces = [f for f in ss.faces if f["id"] not in drop]
+    for key, face_id in list(ss.ingested.items()):
+        if face_id in drop:
+            ss.collapsed[key] = keep
+            del ss.ingested[key]
+
+
+def _review_duplicates(groups: List[List[int]]):
+    '''Flag duplicate groups and offer to merge them into a single face.'''
+    face_by_id = _face_lookup()
+    st.warning(f"{len(groups)} Gruppe(n) mit gleichen oder sehr ähnlichen Bildern gefunden.")
+    with st.expander("Duplikate prüfen"):
+        if st.button("🔗 Alle zusammenführen"):
+            for group in groups:
+                _collapse_faces(group)
+            _rerun()
+        for n, group in enumerate(groups):
+            cols = st.columns(len(group) + 2)
+            for col, face_id in zip(cols, group):
+                col.image(_face_image(face_by_id[face_id], 60), caption=face_by_id[face_id]["name"], width=60)
+            if cols[-2].button("🔗 Zusammenführen", key=f"dup_merge_{n}"):
+                _collapse_faces(group)
+                _rerun()
+            if cols[-1].button("Behalten", key=f"dup_keep_{n}"):
+                st.session_state.dup_ignored.add(frozenset(group))
+                _rerun()
+
+
+# --------------- Deck Archive ---------------
+
+# A deck file is: magic, u64 manifest length, manifest JSON, blob section.
+# The manifest maps each blob hash to [offset, length] within the blob
+# section, so a reader can slice blobs straight out of the file's buffer.
+_ARCHIVE_MAGIC = b"MEMDECK1"
+_ARCHIVE_HEADER = struct.Struct("<8sQ")
+_ARCHIVE_VERSION = 1
+# Allowed range of each layout setting a deck carries (the play sliders)
+_LAYOUT_RANGES = {"cols": (2, 8), "size_px": (80, 400), "card_spacing": (2, 30), "container_scale": (50, 150)}
+_LAYOUT_KEYS = tuple(_LAYOUT_RANGES)
+
+
+def _deck_manifest() -> Dict[str, Any]:
+    '''The current deck (paired faces, back image, layout) as a JSON-able manifest.'''
+    ss = st.session_state
+    paired = {face_id for pair in ss.pairs for face_id in pair}
+    return {
+        "version": _ARCHIVE_VERSION,
+        "back": ss.back_img,
+        "faces": [f for f in ss.faces if f["id"] in paired],
+        "pairs": ss.pairs,
+        "layout": {key: ss[key] for key in _LAYOUT_KEYS},
+    }
+
+
+def _manifest_digests(manifest: Dict[str, Any]) -> List[str]:
+    '''Every blob a manifest references, in a stable order.'''
+    return list(dict.fromkeys(
+        list(manifest["back"].values()) + [d for f in manifest["faces"] for d in f["renditions"].values()]
+    ))
+
+
+def _decode_renditions(value, known: Optional[set]) -> Dict[int, str]:
+    # JSON object keys are strings; renditions are keyed by int edge
+    if not isinstance(value, dict) or not value:
+        raise ValueError("missing renditions")
+    renditions = {}
+    for edge, digest in value.items():
+        if not str(edge).isdigit() or not isinstance(digest, str) or not _DIGEST_RE.fullmatch(digest):
+            raise ValueError(f"invalid rendition {edge!r}: {digest!r}")
+        if known is not None and digest not in known:
+            raise ValueError(f"blob {digest} is not in the deck file")
+        renditions[int(edge)] = digest
+    return renditions
+
+
+def _decode_manifest(manifest, known: Optional[set] = None) -> Dict[str, Any]:
+    '''Validate a parsed manifest and restore its int rendition edges.
+
+    Every blob hash must be well-formed and, when ``known`` is given (the
+    blobs an archive carries), one of those. Raises ValueError otherwise.
+    '''
+    if not isinstance(manifest, dict) or manifest.get("version") != _ARCHIVE_VERSION:
+        raise ValueError("unsupported deck version")
+    manifest["back"] = _decode_renditions(manifest.get("back"), known)
+    faces = manifest.get("faces")
+    if not isinstance(faces, list) or not faces:
+        raise ValueError("deck has no faces")
+    for face in faces:
+        if not isinstance(face, dict) or type(face.get("id")) is not int or not isinstance(face.get("name"), str):
+            raise ValueError("invalid face entry")
+        if not 0 <= face["id"] < 2**31:  # the deck keeps face ids in int32 arrays
+            raise ValueError(f"invalid face id {face['id']}")
+        if not isinstance(face.get("hash"), str) or not _DIGEST_RE.fullmatch(face["hash"]):
+            raise ValueError(f"invalid hash for face {face['name']!r}")
+        face["renditions"] = _decode_renditions(face.get("renditions"), known)
+    ids = {face["id"] for face in faces}
+    if len(ids) != len(faces):
+        raise ValueError("duplicate face ids")
+    pairs = manifest.get("pairs")
+    if not isinstance(pairs, list) or not pairs:
+        raise ValueError("deck has no pairs")
+    paired = []
+    for pair in pairs:
+        if not isinstance(pair, list) or len(pair) != 2 or not all(type(i) is int and i in ids for i in pair):
+            raise ValueError(f"invalid pair {pair!r}")
+        paired.extend(set(pair))
+    if len(paired) != len(set(paired)):
+        raise ValueError("a face is in more than one pair")
+    layout = manifest.get("layout")
+    if not isinstance(layout, dict):
+        raise ValueError("missing layout")
+    for key, value in layout.items():
+        low, high = _LAYOUT_RANGES.get(key, (None, None))
+        if low is None or type(value) is not int or not low <= value <= high:
+            raise ValueError(f"invalid layout setting {key}={value!r}")
+    return manifest
+
+
+def _write_deck_archive(fh):
+    '''Write the current deck with all its image blobs to a binary file object.'''
+    manifest = _deck_manifest()
+    digests = _manifest_digests(manifest)
+    store = _blob_store()
+    blobs, offset = {}, 0
+    for digest in digests:
+        length = os.path.getsize(store._path(digest))
+        blobs[digest] = [offset, length]
+        offset += length
+    manifest["blobs"] = blobs
+    manifest_bytes = json.dumps(manifest).encode()
+    fh.write(_ARCHIVE_HEADER.pack(_ARCHIVE_MAGIC, len(manifest_bytes)))
+    fh.write(manifest_bytes)
+    for digest in digests:
+        fh.write(store.get(digest))
+
+
+def _read_deck_archive(buf) -> Dict[str, Any]:
+    '''Parse a deck file from any buffer and install its blobs; return the manifest.
+
+    Blobs are hashed and written to the blob store straight from slices of
+    ``buf`` (no intermediate copies), e.g. an upload's getbuffer().
+    Raises ValueError if the file is not a valid deck.
+    '''
+    view = memoryview(buf)
+    if len(view) < _ARCHIVE_HEADER.size:
+        raise ValueError("truncated deck file")
+    magic, manifest_len = _ARCHIVE_HEADER.unpack_from(view)
+    if magic != _ARCHIVE_MAGIC:
+        raise ValueError("not a deck file")
+    start = _ARCHIVE_HEADER.size + manifest_len
+    try:
+        manifest = json.loads(bytes(view[_ARCHIVE_HEADER.size:start]))
+    except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+        raise ValueError("corrupt deck manifest") from exc
+    blobs = manifest.get("blobs") if isinstance(manifest, dict) else None
+    if not isinstance(blobs, dict):
+        raise ValueError("corrupt deck manifest")
+    for digest, span in blobs.items():
+        if (not _DIGEST_RE.fullmatch(digest) or not isinstance(span, list) or len(span) != 2
+                or not all(type(n) is int and n >= 0 for n in span)):
+            raise ValueError(f"invalid blob entry {digest!r}")
+    manifest = _decode_manifest(manifest, known=set(blobs))
+    store = _blob_store()
+    for digest, (offset, length) in blobs.items():
+        if digest in store:
+            continue
+        if start + offset + length > len(view):
+            raise ValueError("truncated deck file")
+        blob = view[start + offset:start + offset + length]
+        if _content_hash(blob) != digest:
+            raise ValueError(f"blob {digest} is corrupt")
+        store.put(blob, cache=False)
+    return manifest
+
+
+def _apply_deck_manifest(manifest: Dict[str, Any]):
+    '''Replace the session's images, pairs and layout with a deck and start playing.'''
+    ss = st.session_state
+    ss.back_img = manifest["back"]
+    ss.back_key = None
+    # Renumber from 0 so ids of later uploads stay small, whatever the file used
+    new_id = {face["id"]: i for i, face in enumerate(manifest["faces"])}
+    ss.faces = [{**face, "id": new_id[face["id"]]} for face in manifest["faces"]]
+    ss.ingested = {}
+    ss.collapsed = {}
+    ss.next_face_id = len(ss.faces)
+    ss.pairs = [[new_id[a], new_id[b]] for a, b in manifest["pairs"]]
+    paired = {face_id for pair in ss.pairs for face_id in pair}
+    ss.unpaired_ids = {f["id"] for f in ss.faces} - paired
+    ss.pair_bucket = []
+    ss.auto_proposals = []
+    for key, value in manifest["layout"].items():
+        if key in _LAYOUT_KEYS:
+            ss[key] = value
+    start_game()
+
+
+def _deck_signature() -> str:
+    '''Cheap fingerprint of the current deck, to tell when a saved copy went stale.'''
+    ss = st.session_state
+    return json.dumps([ss.pairs, ss.back_img, [ss[key] for key in _LAYOUT_KEYS]])
+
+
+def _sidebar_deck_export():
+    '''Sidebar button that packs the current deck into a downloadable file.'''
+    ss = st.session_state
+    if not ss.pairs:
+        return
+    # A packed file only stays offered while the deck it holds is unchanged
+    signature = _deck_signature()
+    export = ss.get("deck_export")
+    if export is None or export["signature"] != signature:
+        if st.sidebar.button("💾 Deck speichern"):
+            out = io.BytesIO()
+            _write_deck_archive(out)
+            ss.deck_export = {"signature": signature, "data": out.getvalue()}
+            _rerun()
+    else:
+        # Dropped again once downloaded, so the bytes don't linger in the session
+        st.sidebar.download_button(
+            "⬇️ Deck-Datei herunterladen", data=export["data"], file_name="memory.memdeck",
+            mime="application/octet-stream", on_click=lambda: st.session_state.pop("deck_export", None),
+        )
+
+
+# --------------- Deck Library ---------------
+
+_LIBRARY_ID_RE = re.compile(r"^[0-9a-f]{8}$")
+
+
+def _publish_deck() -> str:
+    '''Publish the current deck to the shared library and return its ID.
+
+    Only the manifest is written; its images already sit in the shared blob
+    store. The ID is derived from the manifest, so publishing the same deck
+    twice yields the same ID.
+    '''
+    data = json.dumps(_deck_manifest(), sort_keys=True).encode()
+    deck_id = _content_hash(data)[:8]
+    path = os.path.join(_LIBRARY_DIR, f"{deck_id}.json")
+    if not os.path.exists(path):
+        os.makedirs(_LIBRARY_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+    return deck_id
+
+
+def _library_digests() -> frozenset:
+    '''Blobs referenced by published decks; they must outlive their publisher.'''
+    digests = set()
+    if os.path.isdir(_LIBRARY_DIR):
+        for name in os.listdir(_LIBRARY_DIR):
+            if name.endswith(".json"):
+                with open(os.path.join(_LIBRARY_DIR, name), "rb") as fh:
+                    digests.update(_manifest_digests(_decode_manifest(json.load(fh))))
+    return frozenset(digests)
+
+
+@st.cache_resource(max_entries=256, show_spinner=False)
+def _library_manifest(deck_id: str) -> Dict[str, Any]:
+    '''A published manifest, parsed once per process for all sessions.'''
+    path = os.path.join(_LIBRARY_DIR, f"{deck_id}.json")
+    try:
+        with open(path, "rb") as fh:
+            manifest = _decode_manifest(json.load(fh))
+    except FileNotFoundError:
+        raise ValueError(f"no deck with ID {deck_id}") from None
+    store = _blob_store()
+    missing = [d for d in _manifest_digests(manifest) if d not in store]
+    if missing:
+        raise ValueError(f"deck {deck_id} is missing {len(missing)} image(s)")
+    return manifest
+
+
+def _open_library_deck(deck_id: str) -> Dict[str, Any]:
+    '''Session copy of a published manifest (the blobs it names stay shared).'''
+    deck_id = deck_id.strip().lower()
+    if not _LIBRARY_ID_RE.match(deck_id):
+        raise ValueError(f"{deck_id!r} is not a deck ID")
+    manifest = _library_manifest(deck_id)
+    return {
+        **manifest,
+        "faces": [dict(face) for face in manifest["faces"]],
+        "pairs": [list(pair) for pair in manifest["pairs"]],
+    }
+
+
+def _sidebar_deck_publish():
+    '''Sidebar button that publishes the current deck and shows its ID.'''
+    ss = st.session_state
+    if not ss.pairs:
+        return
+    published = ss.get("published")
+    if published is not None and published["signature"] == _deck_signature():
+        st.sidebar.success(f"Deck-ID: **{published['id']}**")
+    elif st.sidebar.button("📚 Deck veröffentlichen"):
+        ss.published = {"signature": _deck_signature(), "id": _publish_deck()}
+        _rerun()
 
 
 # --------------- Stage: Setup ---------------
 
+@_timed
 def view_setup():
     st.title("🧠 Memory Spiel")
     st.caption("Jetzt mit anklickbaren Karten!")
@@ -58,31 +1124,77 @@ def view_setup():
     st.session_state.cols = st.sidebar.slider("Spalten", min_value=2, max_value=8, value=st.session_state.cols, step=1)
     st.session_state.size_px = st.sidebar.slider("Kartengröße (px)", min_value=100, max_value=300, value=st.session_state.size_px, step=10)
 
+    # A saved deck skips uploading and pairing entirely
+    deck_file = st.file_uploader("Gespeichertes Deck laden (.memdeck)", type=["memdeck"], key="u_deck")
+    if deck_file is not None and _upload_key(deck_file) != st.session_state.deck_key:
+        st.session_state.deck_key = _upload_key(deck_file)
+        if deck_file.size > _memory_ledger().headroom(st.session_state.ledger_id):
+            st.error(f"{deck_file.name} wurde abgelehnt: Das Speicherkontingent ist erschöpft.")
+        else:
+            try:
+                # getbuffer() exposes the upload without copying it
+                manifest = _read_deck_archive(deck_file.getbuffer())
+            except (ValueError, KeyError, TypeError) as exc:
+                st.error(f"{deck_file.name} ist keine gültige Deck-Datei ({exc}).")
+            else:
+                _apply_deck_manifest(manifest)
+                _rerun()
+
+    # ... or one published to the shared library by another session
+    library_id = st.text_input("Deck-ID aus der Bibliothek", key="library_id", placeholder="z. B. 3f9a1c2e")
+    if st.button("📂 Deck öffnen", disabled=not library_id):
+        try:
+            manifest = _open_library_deck(library_id)
+        except ValueError as exc:
+            st.error(f"Deck konnte nicht geöffnet werden: {exc}")
+        else:
+            _apply_deck_manifest(manifest)
+            _rerun()
+
     st.subheader("1) Rückseiten-Bild hochladen (wird für alle Karten verwendet)")
+    _budget_notice()
     back = st.file_uploader("Rückseiten-Bild", type=["png", "jpg", "jpeg", "webp"], key="u_back")
     if back is not None:
-        st.session_state.back_img = back.read()
-        st.image(st.session_state.back_img, caption="Rückseiten-Bild", width=120)
+        # Only a new upload is read; reruns reuse the stored renditions
+        if _upload_key(back) != st.session_state.back_key and not _fits_budget(back):
+            st.error(f"{back.name} wurde abgelehnt: Das Speicherkontingent ist erschöpft.")
+        elif _upload_key(back) != st.session_state.back_key:
+            _, renditions = _ingest_image(back) if back.size <= _MAX_UPLOAD_BYTES else (None, None)
+            st.session_state.back_key = _upload_key(back) if renditions is not None else None
+            if renditions is not None:
+                st.session_state.back_img = renditions
+        if st.session_state.back_key is None:
+            st.error(f"{back.name} konnte nicht gelesen werden oder ist zu groß ({_upload_limits()}).")
+        else:
+            st.image(_load_image(_pick_rendition(st.session_state.back_img, 120)), caption="Rückseiten-Bild", width=120)
 
     st.subheader("2) Vorderseiten-Bilder hochladen (werden manuell gepaart)")
     face_files = st.file_uploader("Vorderseiten-Bilder", type=["png", "jpg", "jpeg", "webp"], accept_multiple_files=True, key="u_faces")
 
     if face_files:
-        faces = []
-        for i, f in enumerate(face_files):
-            try:
-                content = f.read()
-            except Exception:
-                continue
-            faces.append({"id": i, "name": f.name, "bytes": content})
-        st.session_state.faces = faces
-
-        # Preview grid
+        # Preview grid: one slot per upload, filled as each file finishes
         st.caption("Vorschau der hochgeladenen Bilder")
-        cols = st.columns(min(st.session_state.cols, max(1, len(faces))))
-        for idx, face in enumerate(faces):
-            with cols[idx % len(cols)]:
-                st.image(face["bytes"], caption=face["name"], width=st.session_state.size_px)
+        errors = st.container()
+        cols = st.columns(min(st.session_state.cols, max(1, len(face_files))))
+        slots = [cols[idx % len(cols)].empty() for idx in range(len(face_files))]
+
+        def show_face(idx, face):
+            slots[idx].image(_face_image(face, st.session_state.size_px), caption=face["name"], width=st.session_state.size_px)
+
+        def show_failed(idx, name):
+            errors.warning(f"{name} konnte nicht gelesen werden oder ist zu groß ({_upload_limits()}) und wird übersprungen.")
+
+        rejected = _sync_faces(face_files, on_face=show_face, on_failed=show_failed)
+        if rejected:
+            errors.error(
+                f"{len(rejected)} Bild(er) abgelehnt, weil das Speicherkontingent erschöpft ist: "
+                + ", ".join(rejected)
+            )
+
+        # Duplicates cost memory and payload; let the user merge them
+        groups = _duplicate_groups(st.session_state.faces)
+        if groups:
+            _review_duplicates(groups)
 
     st.markdown("---")
     can_continue = (st.session_state.back_img is not None) and (len(st.session_state.faces) >= 2)
@@ -93,33 +1205,185 @@ def view_setup():
         st.session_state.unpaired_ids = set([f["id"] for f in st.session_state.faces])
         st.session_state.pair_bucket = []
         st.session_state.pairs = []
+        st.session_state.auto_proposals = []
         st.session_state.stage = "pair"
         st.session_state.revealed = []
         st.session_state.mismatch_pending = False
-        st.session_state.deck = []
+        st.session_state.deck = None
+        _rerun()
+
+
+# --------------- Auto Pairing ---------------
+
+# Popcount of every byte value, for Hamming distances on packed hashes
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+@st.cache_resource(max_entries=8192, show_spinner=False)
+def _hash_pixels(digest: str) -> np.ndarray:
+    '''9x8 grayscale thumbnail of a stored image, the input of its dHash.'''
+    with Image.open(io.BytesIO(_load_image(digest))) as im:
+        return np.asarray(im.convert("L").resize((9, 8), Image.BOX), dtype=np.int16)
+
+
+def _dhash_batch(faces: List[Dict[str, Any]]) -> np.ndarray:
+    '''Difference hashes of all faces as an (n, 8) uint8 array, one NumPy batch.'''
+    if not faces:
+        return np.zeros((0, 8), dtype=np.uint8)
+    pixels = np.stack([_hash_pixels(min(f["renditions"].items())[1]) for f in faces])
+    bits = pixels[:, :, 1:] > pixels[:, :, :-1]  # (n, 8, 8)
+    return np.packbits(bits.reshape(len(faces), 64), axis=1)
+
+
+def _hamming_neighbours(hashes: np.ndarray, k: int, block: int = 512) -> Tuple[np.ndarray, np.ndarray]:
+    '''Return (indices, distances) of each hash's k nearest other hashes.
+
+    Distances are computed block-wise as XOR + popcount over the whole set,
+    so memory stays at block * n * 8 bytes and there is no Python loop over
+    pairs.
+    '''
+    n = len(hashes)
+    k = min(k, n - 1)
+    packed = np.ascontiguousarray(hashes).view(np.uint64).ravel()
+    nn_idx = np.empty((n, k), dtype=np.int64)
+    nn_dist = np.empty((n, k), dtype=np.int64)
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+            dist = np.bitwise_count(packed[start:stop, None] ^ packed[None, :])
+        else:
+            dist = _POPCOUNT[hashes[start:stop, None, :] ^ hashes[None, :, :]].sum(axis=2, dtype=np.uint8)
+        dist[np.arange(stop - start), np.arange(start, stop)] = 65  # never yourself
+        idx = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        nn_idx[start:stop] = idx
+        nn_dist[start:stop] = np.take_along_axis(dist, idx, axis=1)
+    return nn_idx, nn_dist
+
+
+def _propose_pairs_by_image(faces: List[Dict[str, Any]], max_distance: int) -> List[List[int]]:
+    '''Pair visually similar faces: closest candidate edges first, each face once.'''
+    if len(faces) < 2:
+        return []
+    nn_idx, nn_dist = _hamming_neighbours(_dhash_batch(faces), k=4)
+    rows = np.repeat(np.arange(len(faces)), nn_idx.shape[1])
+    cols, dists = nn_idx.ravel(), nn_dist.ravel()
+    keep = dists <= max_distance
+    order = np.argsort(dists[keep], kind="stable")
+    taken = np.zeros(len(faces), dtype=bool)
+    pairs = []
+    for i, j in zip(rows[keep][order].tolist(), cols[keep][order].tolist()):
+        if not taken[i] and not taken[j]:
+            taken[i] = taken[j] = True
+            pairs.append([faces[i]["id"], faces[j]["id"]])
+    return pairs
+
+
+# "cat_a.png"/"cat_b.png", "cat-1.jpg"/"cat-2.jpg", "Cat A.png"/"Cat B.png", "cat1"/"cat2".
+# A letter suffix needs a separator, or "dog"/"dot" and "car"/"cat" would pair up.
+_NAME_SUFFIX_RE = re.compile(r"[\s_\-.]+([a-z])$|[\s_\-.]*(\d+)$")
+
+
+def _propose_pairs_by_name(faces: List[Dict[str, Any]]) -> List[List[int]]:
+    '''Pair faces whose file names differ only in a trailing letter/number.'''
+    groups: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+    for face in faces:
+        stem = os.path.splitext(face["name"])[0].lower()
+        match = _NAME_SUFFIX_RE.search(stem)
+        if match is None or match.start() == 0:
+            continue
+        suffix = match.group(1) or match.group(2)
+        groups.setdefault(stem[:match.start()], []).append((suffix.zfill(8), face))
+    pairs = []
+    for members in groups.values():
+        # a/b, 1/2, 3/4 ... in suffix order; an odd one out stays unpaired
+        members.sort(key=lambda m: m[0])
+        for (_, a), (_, b) in zip(members[0::2], members[1::2]):
+            pairs.append([a["id"], b["id"]])
+    return pairs
+
+
+def _toggle_proposal(i: int):
+    st.session_state.auto_rejected ^= {i}
+
+
+def _sidebar_auto_pairs(unpaired: List[Dict[str, Any]]):
+    '''Sidebar controls that compute pair proposals for review.'''
+    with st.sidebar.expander("🤖 Auto-Paare"):
+        mode = st.radio("Paaren nach", ["Bildähnlichkeit", "Dateiname"], key="auto_mode")
+        max_distance = _AUTO_PAIR_MAX_DISTANCE
+        if mode == "Bildähnlichkeit":
+            max_distance = st.slider("Max. Abstand (Bits)", min_value=0, max_value=32, value=_AUTO_PAIR_MAX_DISTANCE, key="auto_max_distance")
+        if st.button("Vorschläge berechnen", disabled=len(unpaired) < 1):
+            if mode == "Bildähnlichkeit":
+                proposals = _propose_pairs_by_image(unpaired, max_distance)
+            else:
+                proposals = _propose_pairs_by_name(unpaired)
+            st.session_state.auto_proposals = proposals
+            st.session_state.auto_rejected = set()
+            # Fresh checkbox keys, so no check state carries over to the new list
+            st.session_state.auto_round += 1
+            st.session_state.auto_page = 0
+            if not proposals:
+                st.info("Keine passenden Paare gefunden.")
+
+
+def _review_auto_pairs(face_by_id: Dict[int, Dict[str, Any]]):
+    '''Show proposed pairs with accept checkboxes; commit or discard them.'''
+    proposals = st.session_state.auto_proposals
+    rejected = st.session_state.auto_rejected
+    st.subheader(f"Vorgeschlagene Paare ({len(proposals) - len(rejected)}/{len(proposals)} ausgewählt)")
+    accept_col, discard_col = st.columns(2)
+    if accept_col.button("✅ Ausgewählte übernehmen", type="primary"):
+        _commit_pairs([p for i, p in enumerate(proposals) if i not in rejected])
+        st.session_state.auto_proposals = []
         _rerun()
+    if discard_col.button("✖️ Vorschläge verwerfen"):
+        st.session_state.auto_proposals = []
+        _rerun()
+
+    offset, page = _paginate(proposals, "auto_page")
+    for i, (a, b) in enumerate(page, start=offset):
+        check_col, img_col1, img_col2 = st.columns([1, 2, 2])
+        check_col.checkbox(f"#{i + 1}", value=i not in rejected, key=f"auto_{st.session_state.auto_round}_{i}", on_change=_toggle_proposal, args=(i,))
+        img_col1.image(_face_image(face_by_id[a], 80), caption=face_by_id[a]["name"], width=80)
+        img_col2.image(_face_image(face_by_id[b], 80), caption=face_by_id[b]["name"], width=80)
+    st.divider()
 
 
 # --------------- Stage: Pair ---------------
 
-def view_pair():
-    st.title("👫 Paare erstellen")
-    st.caption("Wähle zwei Bilder aus, um ein Paar zu erstellen. Du kannst ein Bild mit sich selbst paaren.")
+def _commit_pairs(pairs: List[List[int]]) -> int:
+    '''Add pairs whose images are still unpaired; return how many were added.'''
+    added = 0
+    for a, b in pairs:
+        if a in st.session_state.unpaired_ids and b in st.session_state.unpaired_ids:
+            st.session_state.pairs.append([a, b])
+            # Remove from unpaired set (self-pair removes once)
+            st.session_state.unpaired_ids.discard(a)
+            st.session_state.unpaired_ids.discard(b)
+            added += 1
+    return added
 
-    # Sidebar controls for pairing
-    st.sidebar.header("Paar-Verwaltung")
-    
+
+def _apply_pairing_batch():
+    '''Apply a batch committed by the pairing board, once, before anything renders.'''
+    batch = st.session_state.get("pairing_board")
+    if batch and batch.get("batch") != st.session_state.applied_batch:
+        st.session_state.applied_batch = batch["batch"]
+        _commit_pairs(batch["pairs"])
+
+
+def _sidebar_pair_bucket(face_by_id: Dict[int, Dict[str, Any]]):
+    '''Per-click pairing flow: show the pair bucket and its commit buttons.'''
     # Add Pair bucket status to sidebar - show both images side by side
     st.sidebar.subheader("Aktuelles Paar")
-    face_by_id = _face_lookup()
-    
     if len(st.session_state.pair_bucket) == 0:
         st.sidebar.info("Wähle das erste Bild aus")
     elif len(st.session_state.pair_bucket) == 1:
         col1, col2 = st.sidebar.columns(2)
         with col1:
             fid = st.session_state.pair_bucket[0]
-            st.image(face_by_id[fid]["bytes"], caption=face_by_id[fid]["name"], width=70)
+            st.image(_face_image(face_by_id[fid], 70), caption=face_by_id[fid]["name"], width=70)
         with col2:
             st.write("**+**")
             st.write("Wähle zweites Bild")
@@ -127,26 +1391,41 @@ def view_pair():
         col1, col2, col3 = st.sidebar.columns([1,1,1])
         with col1:
             fid1 = st.session_state.pair_bucket[0]
-            st.image(face_by_id[fid1]["bytes"], caption=face_by_id[fid1]["name"], width=60)
+            st.image(_face_image(face_by_id[fid1], 60), caption=face_by_id[fid1]["name"], width=60)
         with col2:
             st.write("**↔**")
         with col3:
             fid2 = st.session_state.pair_bucket[1]
-            st.image(face_by_id[fid2]["bytes"], caption=face_by_id[fid2]["name"], width=60)
+            st.image(_face_image(face_by_id[fid2], 60), caption=face_by_id[fid2]["name"], width=60)
         
         # Manual commit button
         if st.sidebar.button("✅ Paar erstellen", type="primary"):
-            a, b = st.session_state.pair_bucket
-            st.session_state.pairs.append([a, b])
-            # Remove from unpaired set (self-pair removes once)
-            st.session_state.unpaired_ids.discard(a)
-            st.session_state.unpaired_ids.discard(b)
+            _commit_pairs([st.session_state.pair_bucket])
             st.session_state.pair_bucket = []
             _rerun()
         
         if st.sidebar.button("🗑️ Auswahl löschen"):
             st.session_state.pair_bucket = []
             _rerun()
+
+
+@_timed
+def view_pair():
+    st.title("👫 Paare erstellen")
+    st.caption("Wähle zwei Bilder aus, um ein Paar zu erstellen. Du kannst ein Bild mit sich selbst paaren.")
+
+    if _USE_COMPONENTS:
+        _apply_pairing_batch()
+    _prebuild_payload()
+
+    # Sidebar controls for pairing
+    st.sidebar.header("Paar-Verwaltung")
+    face_by_id = _face_lookup()
+    
+    unpaired = [f for f in st.session_state.faces if f["id"] in st.session_state.unpaired_ids]
+    if not _USE_COMPONENTS:
+        _sidebar_pair_bucket(face_by_id)
+    _sidebar_auto_pairs(unpaired)
     
     st.sidebar.markdown("---")
     
@@ -161,25 +1440,52 @@ def view_pair():
     if st.sidebar.button("▶️ Spiel starten", disabled=not can_start):
         start_game()
         _rerun()
+    _sidebar_deck_export()
+    _sidebar_deck_publish()
         
     st.sidebar.markdown("---")
     if st.sidebar.button("⬅️ Zurück zur Einrichtung"):
         st.session_state.stage = "setup"
         _rerun()
 
-    # Unpaired grid with "Add to pair" buttons
+    st.sidebar.markdown("---")
+    st.session_state.page_size = st.sidebar.select_slider("Bilder pro Seite", options=_PAGE_SIZES, value=st.session_state.page_size)
+    thumb_px = min(st.session_state.size_px, _THUMB_PX)
+
+    if st.session_state.auto_proposals:
+        _review_auto_pairs(face_by_id)
+
+    # Unpaired grid with "Add to pair" buttons; only the current page is rendered
     st.subheader("Verfügbare Bilder")
-    unpaired = [face_by_id[i] for i in st.session_state.unpaired_ids]
     if not unpaired:
         st.success("Alle Bilder sind gepaart. Du kannst das Spiel starten!")
+    elif _USE_COMPONENTS:
+        # Pairs are built client-side and arrive as one batch (see _apply_pairing_batch).
+        # Only the current page's thumbnails are sent; staged pairs survive page changes.
+        st.write(f"**{len(unpaired)} Bilder** verfügbar zum Paaren")
+        _, page = _paginate(unpaired, "unpaired_page")
+        delivery = _image_delivery()
+        _pairing_board(
+            faces=[
+                {"id": f["id"], "name": f["name"], "img": _image_src(_pick_rendition(f["renditions"], thumb_px), delivery)}
+                for f in page
+            ],
+            unpaired_ids=sorted(st.session_state.unpaired_ids),
+            cols=st.session_state.cols,
+            thumb_px=thumb_px,
+            image_base=_IMAGE_BASE_URL,
+            image_port=_IMAGE_SERVER_PORT,
+            key="pairing_board",
+        )
     else:
         st.write(f"**{len(unpaired)} Bilder** verfügbar zum Paaren")
+        _, page = _paginate(unpaired, "unpaired_page")
         
-        grid_cols = st.columns(min(st.session_state.cols, max(1, len(unpaired))))
+        grid_cols = st.columns(min(st.session_state.cols, max(1, len(page))))
         clicked_to_add = None
-        for idx, face in enumerate(unpaired):
+        for idx, face in enumerate(page):
             with grid_cols[idx % len(grid_cols)]:
-                st.image(face["bytes"], caption=face["name"], width=st.session_state.size_px)
+                st.image(_face_image(face, thumb_px), caption=face["name"], width=thumb_px)
                 
                 # Check if this image is already in pair bucket
                 is_selected = face["id"] in st.session_state.pair_bucket
@@ -203,7 +1509,8 @@ def view_pair():
         
         pairs_to_delete = []  # Track which pairs to delete
         
-        for i, (a, b) in enumerate(st.session_state.pairs):
+        offset, page = _paginate(st.session_state.pairs, "pairs_page")
+        for i, (a, b) in enumerate(page, start=offset):
             with pairs_container:
                 # Create columns for pair display and delete button
                 pair_col, delete_col = st.columns([4, 1])
@@ -212,10 +1519,10 @@ def view_pair():
                     # Display the pair images side by side
                     img_col1, img_col2 = st.columns(2)
                     with img_col1:
-                        st.image(face_by_id[a]["bytes"], width=100)
+                        st.image(_face_image(face_by_id[a], 100), width=100)
                         st.caption(face_by_id[a]['name'])
                     with img_col2:
-                        st.image(face_by_id[b]["bytes"], width=100) 
+                        st.image(_face_image(face_by_id[b], 100), width=100) 
                         st.caption(face_by_id[b]['name'])
                 
                 with delete_col:
@@ -239,493 +1546,275 @@ def view_pair():
 
 # --------------- Build & Play ---------------
 
-def start_game():
-    '''Build the deck from pairs and enter play stage.'''
-    # Build 2 cards per pair with same pair_idx
-    deck = []
-    pos = 0
-    for pair_idx, (a, b) in enumerate(st.session_state.pairs):
-        deck.append({"pos": pos, "pair_idx": pair_idx, "face_id": a, "matched": False})
-        pos += 1
-        deck.append({"pos": pos, "pair_idx": pair_idx, "face_id": b, "matched": False})
-        pos += 1
-    random.shuffle(deck)
+def _build_deck(pairs: List[List[int]], seed: int) -> Dict[str, Any]:
+    '''Two cards per pair, shuffled reproducibly: the same seed gives the same deck.
+
+    Cards are parallel int32 arrays in play order. ``pos`` is a card's
+    position before shuffling, so its pair is ``pos // 2``.
+    '''
+    n = 2 * len(pairs)
+    order = np.random.default_rng(seed).permutation(n).astype(np.int32)
+    face_ids = np.asarray(pairs, dtype=np.int32).reshape(n)
+    return {"seed": seed, "pos": order, "pair_idx": order // 2, "face_id": face_ids[order]}
+
+
+def _deck_size() -> int:
+    deck = st.session_state.deck
+    return 0 if deck is None else len(deck["pos"])
+
+
+def _new_game_stats() -> Dict[str, int]:
+    '''Running totals of one game, filled from the board's move reports.'''
+    return {"moves": 0, "matches": 0, "duration_ms": 0, "match_ms": 0}
+
+
+def _apply_board_events():
+    '''Fold the board's latest batch of moves into the game stats (once per batch).
+
+    The board reports {mount, seq, deck_id, moves, won}, each move being
+    [t_ms, pos1, pos2, hit, time_to_match_ms]. seq counts per mount of the
+    board and is echoed back as ss.board_ack. Only totals are kept, and
+    only from moves on the current deck. A ``perf`` entry
+    (MEMORY_CLIENT_PERF) is passed on to the log. ``need`` and ``dropped``
+    list image digests the board lacks and has let go of.
+    '''
+    ss = st.session_state
+    report = ss.get("memory_board")
+    if not report:
+        return
+    ack = ss.board_ack
+    if report.get("mount") == ack["mount"] and report["seq"] <= ack["seq"]:
+        return
+    ss.board_ack = {"mount": report.get("mount"), "seq": report["seq"]}
+    # Images the board lost (e.g. after a remount) go out again with this run;
+    # the ones it dropped are sent again when they are referenced again
+    ss.board_sent.difference_update(report.get("need", ()))
+    ss.board_sent.difference_update(report.get("dropped", ()))
+    if report.get("perf"):
+        _log.info(json.dumps({"session": ss.ledger_id, "stage": ss.stage, "client_perf": report["perf"]}))
+    if report.get("deck_id") != ss.deck_id:
+        return
+    stats = ss.game_stats
+    for t_ms, pos1, pos2, hit, match_ms in report["moves"]:
+        stats["moves"] += 1
+        stats["duration_ms"] = max(stats["duration_ms"], t_ms)
+        if hit:
+            stats["matches"] += 1
+            stats["match_ms"] += match_ms
+            ss.revealed.extend([pos1, pos2])
+        ss.mismatch_pending = not hit
+    if report["won"]:
+        ss.game_won = True
+        ss.mismatch_pending = False
+        ss.stage = "win"
+        _rerun()
+
+
+@_timed
+def start_game(seed: Optional[int] = None):
+    '''Build the deck from pairs and enter play stage (a given seed replays that shuffle).'''
+    if seed is None:
+        seed = random.getrandbits(32)
+    deck = _build_deck(st.session_state.pairs, seed)
     # Reset play state
     st.session_state.deck = deck
+    st.session_state.deck_id = f"{random.getrandbits(64):016x}"
     st.session_state.revealed = []
     st.session_state.mismatch_pending = False
     st.session_state.game_won = False
+    st.session_state.game_stats = _new_game_stats()
     st.session_state.stage = "play"
 
 
-def generate_memory_game_html():
-    """Generate complete HTML with embedded JavaScript for zero-reload gameplay."""
-    
-    size = st.session_state.size_px
-    cols_count = st.session_state.cols
-    spacing = st.session_state.card_spacing
+def _board_layout() -> Dict[str, Any]:
+    '''Layout parameters; the board applies these client-side without rebuilding.'''
     container_scale = st.session_state.get("container_scale", 100)
+    return {
+        "size_px": st.session_state.size_px,
+        "card_spacing": st.session_state.card_spacing,
+        "cols": st.session_state.cols,
+        "container_scale": container_scale,
+        # Calculate height to use full available space
+        "height": int(800 * (container_scale / 100)),
+    }
+
+
+@st.cache_resource(show_spinner=False)
+def _prebuild_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-prebuild")
+
+
+def _prebuild_payload():
+    '''Encode the board images of the current pairs in the background.
+
+    Runs on every pairing rerun: images of new pairs are queued, queued work
+    for pairs that were removed is cancelled. The encodings land in the
+    shared _image_to_base64 cache, so starting the game only shuffles and
+    looks them up. URL delivery has nothing to encode.
+    '''
+    ss = st.session_state
+    if ss.back_img is None or _image_delivery() != "inline":
+        return
+    face_by_id = _face_lookup()
+    wanted = {_pick_rendition(ss.back_img, ss.size_px)}
+    for pair in ss.pairs:
+        wanted.update(_pick_rendition(face_by_id[face_id]["renditions"], ss.size_px) for face_id in pair)
+    jobs = ss.setdefault("prebuild_jobs", {})  # digest -> Future
+    for digest in list(jobs):
+        if digest not in wanted:
+            jobs.pop(digest).cancel()
+    for digest in wanted.difference(jobs):
+        jobs[digest] = _prebuild_pool().submit(_image_to_base64, digest)
+
+
+def _board_data(delivery: Optional[str] = None) -> Dict[str, Any]:
+    '''Deck, face table and back image for the board.'''
+    size = st.session_state.size_px
     face_by_id = _face_lookup()
     
-    # Convert all images to base64
-    back_img_b64 = _image_to_base64(st.session_state.back_img)
-    
-    # Build card data for JavaScript - properly serialize to JSON
-    cards_data = []
-    for card in st.session_state.deck:
-        face_img_b64 = _image_to_base64(face_by_id[card["face_id"]]["bytes"])
-        cards_data.append({
-            "pos": card["pos"],
-            "pair_idx": card["pair_idx"],
-            "face_id": card["face_id"],
-            "face_name": face_by_id[card["face_id"]]["name"],
-            "face_img": face_img_b64,
-            "matched": False
-        })
-    
-    # Properly serialize to JSON
-    cards_json = json.dumps(cards_data)
-    total_pairs = len(st.session_state.pairs)
+    # Reference all images (data URI, hash URL or cache key), using the rendition that fits the card size
+    delivery = delivery or _image_delivery()
+    back_img_src = _image_src(_pick_rendition(st.session_state.back_img, size), delivery)
     
-    # Generate the complete HTML
-    html_content = f"""
-<!DOCTYPE html>
-<html lang="de">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Memory Game</title>
-    <style>
-        * {{
-            box-sizing: border-box;
-        }}
-        
-        body {{
-            margin: 0;
-            padding: 10px;
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
-            background: #f8f9fa;
-            height: 100vh;
-            overflow: hidden;
-            display: flex;
-            align-items: flex-start;
-            justify-content: center;
-        }}
-        
-        .game-container {{
-            max-width: 1200px;
-            height: 100vh;
-            display: flex;
-            flex-direction: column;
-            transform: scale({container_scale / 100});
-            transform-origin: center top;
-            transition: transform 0.3s ease;
-        }}
-        
-        .progress-container {{
-            background: white;
-            border-radius: 15px;
-            padding: 15px 20px;
-            margin-bottom: 10px;
-            box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-            flex-shrink: 0;
-        }}
-        
-        .progress-bar {{
-            width: 100%;
-            height: 8px;
-            background: #e0e0e0;
-            border-radius: 4px;
-            overflow: hidden;
-        }}
-        
-        .progress-fill {{
-            height: 100%;
-            background: linear-gradient(90deg, #4CAF50, #45a049);
-            width: 0%;
-            transition: width 0.5s ease;
-        }}
-        
-        .progress-text {{
-            margin-top: 10px;
-            color: #666;
-            font-size: 14px;
-        }}
-        
-        .cards-grid {{
-            display: grid;
-            grid-template-columns: repeat({cols_count}, 1fr);
-            gap: {spacing}px;
-            justify-items: center;
-            align-items: center;
-            padding: 20px;
-            background: white;
-            border-radius: 15px;
-            box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-            flex: 1;
-            overflow: hidden;
-            max-height: calc(100vh - 120px);
-        }}
-        
-        .card {{
-            width: {size}px;
-            height: {size}px;
-            position: relative;
-            cursor: pointer;
-            border-radius: 12px;
-            transition: transform 0.2s ease;
-            perspective: 1000px;
-        }}
-        
-        .card:hover:not(.matched):not(.flipped) {{
-            transform: scale(1.05);
-        }}
-        
-        .card-inner {{
-            position: relative;
-            width: 100%;
-            height: 100%;
-            transition: transform 0.6s;
-            transform-style: preserve-3d;
-        }}
-        
-        .card.flipped .card-inner {{
-            transform: rotateY(180deg);
-        }}
-        
-        .card.matched .card-inner {{
-            transform: rotateY(180deg);
-        }}
-        
-        .card-face {{
-            position: absolute;
-            width: 100%;
-            height: 100%;
-            backface-visibility: hidden;
-            border-radius: 12px;
-            box-shadow: 0 4px 8px rgba(0,0,0,0.1);
-            overflow: hidden;
-            border: 3px solid #ddd;
-        }}
-        
-        .card-back {{
-            background: #ddd;
-        }}
-        
-        .card-front {{
-            transform: rotateY(180deg);
-        }}
-        
-        .card-face img {{
-            width: 100%;
-            height: 100%;
-            object-fit: cover;
-            display: block;
-        }}
-        
-        .card.matched {{
-            pointer-events: none;
-        }}
-        
-        .card.matched .card-face {{
-            border-color: #4CAF50;
-        }}
-        
-        .card.matched::after {{
-            content: '✓';
-            position: absolute;
-            top: 50%;
-            left: 50%;
-            transform: translate(-50%, -50%);
-            color: #4CAF50;
-            font-size: 32px;
-            font-weight: bold;
-            background: rgba(255,255,255,0.9);
-            width: 50px;
-            height: 50px;
-            border-radius: 50%;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            z-index: 10;
-            animation: matchPulse 1s ease-in-out;
-        }}
-        
-        @keyframes matchPulse {{
-            0% {{ transform: translate(-50%, -50%) scale(0); }}
-            50% {{ transform: translate(-50%, -50%) scale(1.2); }}
-            100% {{ transform: translate(-50%, -50%) scale(1); }}
-        }}
-        
-        .win-message {{
-            position: fixed;
-            top: 50%;
-            left: 50%;
-            transform: translate(-50%, -50%);
-            background: white;
-            padding: 40px;
-            border-radius: 20px;
-            box-shadow: 0 10px 30px rgba(0,0,0,0.3);
-            text-align: center;
-            z-index: 1000;
-            display: none;
-        }}
-        
-        .win-message.show {{
-            display: block;
-            animation: winAppear 0.5s ease-out;
-        }}
-        
-        @keyframes winAppear {{
-            from {{ transform: translate(-50%, -50%) scale(0.5); opacity: 0; }}
-            to {{ transform: translate(-50%, -50%) scale(1); opacity: 1; }}
-        }}
-        
-        .overlay {{
-            position: fixed;
-            top: 0;
-            left: 0;
-            width: 100%;
-            height: 100%;
-            background: rgba(0,0,0,0.5);
-            z-index: 999;
-            display: none;
-        }}
-        
-        .overlay.show {{
-            display: block;
-        }}
-        
-        .win-button {{
-            background: #4CAF50;
-            color: white;
-            border: none;
-            padding: 15px 30px;
-            border-radius: 25px;
-            font-size: 16px;
-            cursor: pointer;
-            margin: 10px;
-            transition: background 0.3s;
-        }}
-        
-        .win-button:hover {{
-            background: #45a049;
-        }}
-    </style>
-</head>
-<body>
-    <div class="game-container">
-        <div class="progress-container">
-            <div class="progress-bar">
-                <div class="progress-fill" id="progressFill"></div>
-            </div>
-            <div class="progress-text" id="progressText">Fortschritt: 0/{total_pairs} Paare gefunden</div>
-        </div>
-        
-        <div class="cards-grid" id="cardsGrid">
-            <!-- Cards will be generated by JavaScript -->
-        </div>
-    </div>
+    # Face table: one entry per unique image (by content hash); cards refer to
+    # it by index so the payload grows with unique images, not with cards.
+    deck = st.session_state.deck
+    face_ids, card_faces = np.unique(deck["face_id"], return_inverse=True)
+    face_table = []
+    face_index = {}  # content hash -> index into face_table
+    table_idx = np.empty(len(face_ids), dtype=np.int32)
+    for k, face_id in enumerate(face_ids.tolist()):
+        face = face_by_id[face_id]
+        digest = _pick_rendition(face["renditions"], size)
+        if digest not in face_index:
+            face_index[digest] = len(face_table)
+            face_table.append({
+                "name": face["name"],
+                "img": _image_src(digest, delivery),
+            })
+        table_idx[k] = face_index[digest]
     
-    <div class="overlay" id="overlay"></div>
-    <div class="win-message" id="winMessage">
-        <h2>🎉 Alle Paare gefunden!</h2>
-        <p>Herzlichen Glückwunsch zum Gewinn!</p>
-        <button class="win-button" onclick="location.reload()">🔄 Nochmal spielen</button>
-    </div>
-
-    <script>
-        console.log('Memory game script starting...');
-        
-        // Game state
-        const CARDS_DATA = {cards_json};
-        const BACK_IMAGE = "data:image/png;base64,{back_img_b64}";
-        const TOTAL_PAIRS = {total_pairs};
-        
-        console.log('Cards data:', CARDS_DATA);
-        console.log('Total pairs:', TOTAL_PAIRS);
-        
-        let gameState = {{
-            revealed: [],
-            matchedPairs: 0,
-            isProcessing: false
-        }};
-        
-        // Initialize game
-        function initGame() {{
-            console.log('Initializing game...');
-            
-            const grid = document.getElementById('cardsGrid');
-            if (!grid) {{
-                console.error('Grid container not found!');
-                return;
-            }}
-            
-            grid.innerHTML = '';
-            
-            CARDS_DATA.forEach((cardData, index) => {{
-                console.log(`Creating card ${{index}}:`, cardData);
-                const card = createCard(cardData);
-                grid.appendChild(card);
-            }});
-            
-            updateProgress();
-        }}
-        
-        function createCard(cardData) {{
-            const card = document.createElement('div');
-            card.className = 'card';
-            card.dataset.pos = cardData.pos;
-            card.dataset.pairIdx = cardData.pair_idx;
-            
-            const backImage = `<img src="${{BACK_IMAGE}}" alt="Card back" onerror="console.error('Failed to load back image')" />`;
-            const frontImage = `<img src="data:image/png;base64,${{cardData.face_img}}" alt="${{cardData.face_name}}" onerror="console.error('Failed to load front image for ${{cardData.face_name}}')" />`;
-            
-            card.innerHTML = `
-                <div class="card-inner">
-                    <div class="card-face card-back">
-                        ${{backImage}}
-                    </div>
-                    <div class="card-face card-front">
-                        ${{frontImage}}
-                    </div>
-                </div>
-            `;
-            
-            card.addEventListener('click', () => handleCardClick(card));
-            return card;
-        }}
-        
-        function handleCardClick(card) {{
-            console.log('Card clicked:', card.dataset.pos);
-            
-            if (gameState.isProcessing) {{
-                console.log('Game is processing, ignoring click');
-                return;
-            }}
-            if (card.classList.contains('flipped') || card.classList.contains('matched')) {{
-                console.log('Card already flipped or matched, ignoring click');
-                return;
-            }}
-            if (gameState.revealed.length >= 2) {{
-                console.log('Already 2 cards revealed, ignoring click');
-                return;
-            }}
-            
-            // Flip card
-            card.classList.add('flipped');
-            gameState.revealed.push(card);
-            console.log('Revealed cards:', gameState.revealed.length);
-            
-            if (gameState.revealed.length === 2) {{
-                gameState.isProcessing = true;
-                setTimeout(checkMatch, 800);
-            }}
-        }}
-        
-        function checkMatch() {{
-            const [card1, card2] = gameState.revealed;
-            const pair1 = card1.dataset.pairIdx;
-            const pair2 = card2.dataset.pairIdx;
-            
-            console.log(`Checking match: ${{pair1}} vs ${{pair2}}`);
-            
-            if (pair1 === pair2) {{
-                // Match!
-                console.log('Match found!');
-                card1.classList.add('matched');
-                card2.classList.add('matched');
-                gameState.matchedPairs++;
-                updateProgress();
-                
-                if (gameState.matchedPairs === TOTAL_PAIRS) {{
-                    setTimeout(showWin, 500);
-                }}
-            }} else {{
-                // No match - flip back
-                console.log('No match, flipping back');
-                setTimeout(() => {{
-                    card1.classList.remove('flipped');
-                    card2.classList.remove('flipped');
-                }}, 1000);
-            }}
-            
-            gameState.revealed = [];
-            gameState.isProcessing = false;
-        }}
-        
-        function updateProgress() {{
-            const progress = (gameState.matchedPairs / TOTAL_PAIRS) * 100;
-            const progressFill = document.getElementById('progressFill');
-            const progressText = document.getElementById('progressText');
-            
-            if (progressFill) {{
-                progressFill.style.width = progress + '%';
-            }}
-            if (progressText) {{
-                progressText.textContent = `Fortschritt: ${{gameState.matchedPairs}}/${{TOTAL_PAIRS}} Paare gefunden`;
-            }}
-        }}
-        
-        function showWin() {{
-            console.log('Game won!');
-            document.getElementById('overlay').classList.add('show');
-            document.getElementById('winMessage').classList.add('show');
-            
-            // Trigger confetti effect
-            createConfetti();
-        }}
-        
-        function createConfetti() {{
-            for (let i = 0; i < 50; i++) {{
-                setTimeout(() => {{
-                    const confetti = document.createElement('div');
-                    confetti.style.cssText = `
-                        position: fixed;
-                        width: 10px;
-                        height: 10px;
-                        background: hsl(${{Math.random() * 360}}deg, 70%, 60%);
-                        top: -10px;
-                        left: ${{Math.random() * 100}}%;
-                        animation: fall ${{2 + Math.random() * 3}}s linear forwards;
-                        z-index: 1001;
-                        border-radius: 50%;
-                    `;
-                    document.body.appendChild(confetti);
-                    
-                    setTimeout(() => confetti.remove(), 5000);
-                }}, i * 100);
-            }}
-        }}
-        
-        // Add CSS for confetti animation
-        const style = document.createElement('style');
-        style.textContent = `
-            @keyframes fall {{
-                to {{
-                    transform: translateY(100vh) rotate(360deg);
-                }}
-            }}
-        `;
-        document.head.appendChild(style);
-        
-        // Start the game when DOM is ready
-        if (document.readyState === 'loading') {{
-            document.addEventListener('DOMContentLoaded', initGame);
-        }} else {{
-            initGame();
-        }}
-        
-        console.log('Memory game script loaded successfully');
-    </script>
-</body>
-</html>
-    """
-    
-    return html_content
+    return {
+        "deck_id": st.session_state.deck_id,
+        "deck": {
+            "seed": deck["seed"],
+            "pos": deck["pos"].tolist(),
+            "pair_idx": deck["pair_idx"].tolist(),
+            "face": table_idx[card_faces].tolist(),
+        },
+        "faces": face_table,
+        "back": back_img_src,
+        "total_pairs": len(st.session_state.pairs),
+        "image_base": _IMAGE_BASE_URL,
+        "image_port": _IMAGE_SERVER_PORT,
+    }
+
+
+def _board_images(board: Dict[str, Any]) -> Dict[str, str]:
+    '''Data URIs for the board's "#<digest>" refs that the mounted component lacks.
+
+    ss.board_sent holds what the component got since it was mounted, so a
+    layout change or a reshuffle of the same faces sends no image data.
+    A fresh board gets the back and about _BOARD_IMAGE_BATCH_BYTES of faces
+    (in card order, so the top rows come first) and then asks for the next
+    batch after each one arrives; cards become clickable batch by batch.
+    '''
+    ss = st.session_state
+    faces = board["faces"]
+    refs = [board["back"]] + [faces[idx]["img"] for idx in dict.fromkeys(board["deck"]["face"])]
+    images, batch_bytes = {}, 0
+    for ref in dict.fromkeys(refs):
+        if batch_bytes >= _BOARD_IMAGE_BATCH_BYTES:
+            break
+        digest = ref[1:]
+        if ref.startswith("#") and digest not in ss.board_sent:
+            images[digest] = _image_to_data_uri(digest)
+            batch_bytes += len(images[digest])
+    ss.board_sent.update(images)
+    return images
+
+
+def _client_config() -> Dict[str, Any]:
+    return {"log_level": _CLIENT_LOG_LEVEL, "perf_report": _CLIENT_PERF_REPORT}
+
+
+def _deck_hash() -> str:
+    '''Hash of everything _board_data() depends on: deck order and the chosen images.'''
+    size = st.session_state.size_px
+    face_by_id = _face_lookup()
+    deck = st.session_state.deck
+    h = hashlib.sha1(f"{st.session_state.deck_id}|{_image_delivery()}|{len(st.session_state.pairs)}".encode())
+    h.update(_pick_rendition(st.session_state.back_img, size).encode())
+    h.update(deck["pos"].tobytes())
+    h.update(deck["face_id"].tobytes())
+    for face_id in np.unique(deck["face_id"]).tolist():
+        face = face_by_id[face_id]
+        h.update(f"|{face_id},{face['name']},{_pick_rendition(face['renditions'], size)}".encode())
+    return h.hexdigest()
+
 
+def _load_board_template() -> Tuple[str, str, str]:
+    '''Read the board shell once and split it where the boot data and face chunks go.'''
+    with open(os.path.join(_BOARD_DIR, "index.html"), encoding="utf-8") as fh:
+        head, tail = fh.read().split("<!-- BOARD_BOOT -->", 1)
+    body, end = tail.rsplit("</body>", 1)
+    return head, body, "</body>" + end
 
+
+_BOARD_TEMPLATE = _load_board_template()
+# Face data follows the board script in chunks of about this many bytes
+_BOARD_CHUNK_BYTES = 64 * 1024
+# Image data the board component gets per rerun; it asks for the rest
+_BOARD_IMAGE_BATCH_BYTES = 512 * 1024
+
+
+def _script_json(value) -> str:
+    # Escape "</" so face names can't close the script element
+    return json.dumps(value).replace("</", "<\\/")
+
+
+def _render_board_document(boot: Dict[str, Any]) -> str:
+    '''The standalone board, ordered for progressive rendering.
+
+    The boot script ahead of the board carries the deck and back image
+    only, so the grid of card backs paints as soon as the first few KiB are
+    parsed. The face table follows in small <script> chunks that the browser
+    runs as it parses them; each one makes its cards clickable. Streamlit
+    ships the srcdoc in one message, so this orders parsing and painting,
+    not the transfer; the component board streams its images instead (see
+    _board_images).
+    '''
+    faces = boot["board"]["faces"]
+    boot["board"] = {**boot["board"], "faces": [], "face_count": len(faces)}
+    chunks, chunk, chunk_bytes, offset = [], [], 0, 0
+    for i, face in enumerate(faces):
+        chunk.append(face)
+        chunk_bytes += len(face["img"])
+        if chunk_bytes >= _BOARD_CHUNK_BYTES or i == len(faces) - 1:
+            chunks.append(f"<script>addFaces({offset}, {_script_json(chunk)});</script>\n")
+            offset, chunk, chunk_bytes = i + 1, [], 0
+    head, body, end = _BOARD_TEMPLATE
+    return f"{head}<script>window.BOARD_BOOT = {_script_json(boot)};</script>{body}{''.join(chunks)}{end}"
+
+
+@_timed
+def generate_memory_game_html():
+    """Generate a standalone HTML board (template plus inlined data) for zero-reload gameplay."""
+    # Memoized per session, keyed by (deck hash, layout): reruns that change
+    # neither reuse the document, and it goes away with the session.
+    layout = _board_layout()
+    key = (_deck_hash(), tuple(sorted(layout.items())))
+    memo = st.session_state.board_document
+    if memo is None or memo[0] != key:
+        boot = {"board": _board_data(), "layout": layout, "client": _client_config()}
+        memo = st.session_state.board_document = (key, _render_board_document(boot))
+    return memo[1]
+
+
+@_timed
 def view_play():
+    _apply_board_events()
+
     # Sidebar controls for gameplay
     st.sidebar.header("Spiel-Einstellungen")
     st.session_state.size_px = st.sidebar.slider("Kartengröße (px)", min_value=80, max_value=400, value=st.session_state.size_px, step=10)
@@ -745,6 +1834,12 @@ def view_play():
         start_game()
         _rerun()
         
+    # Any shuffle can be replayed from its number (the deck seed)
+    seed = st.sidebar.number_input("Mischung Nr.", min_value=0, max_value=2**32 - 1, value=int(st.session_state.deck["seed"]), step=1)
+    if st.sidebar.button("🔁 Mischung Nr. spielen"):
+        start_game(int(seed))
+        _rerun()
+        
     if st.sidebar.button("✏️ Paare ändern"):
         st.session_state.stage = "pair"
         st.session_state.revealed = []
@@ -754,18 +1849,33 @@ def view_play():
     if st.sidebar.button("🧰 Zurück zur Einrichtung"):
         st.session_state.stage = "setup"
         _rerun()
+    _sidebar_deck_export()
 
     # Game stats in sidebar
     st.sidebar.markdown("---")
     st.sidebar.header("Spiel-Info")
-    st.sidebar.metric("Karten gesamt", len(st.session_state.deck))
+    st.sidebar.metric("Karten gesamt", _deck_size())
     st.sidebar.metric("Paare zu finden", len(st.session_state.pairs))
 
-    # Generate and render the pure HTML game - full page
-    game_html = generate_memory_game_html()
-    # Calculate height to use full available space
-    scaled_height = int(800 * (st.session_state.get("container_scale", 100) / 100))
-    components.html(game_html, height=scaled_height, scrolling=False)
+    # Render the board. The component stays mounted across reruns: layout
+    # tweaks and reshuffles arrive as new args and keep the running game.
+    layout = _board_layout()
+    if _USE_COMPONENTS:
+        # Inline images travel once per mount, referenced by digest from then on
+        inline = _image_delivery() == "inline"
+        board = _board_data("ref" if inline else "url")
+        images = _board_images(board) if inline else {}
+        if _DEBUG:
+            _perf_count("payload_bytes", len(json.dumps(board)) + sum(len(uri) for uri in images.values()))
+        _memory_board(
+            board=board, layout=layout, images=images, ack=st.session_state.board_ack,
+            client=_client_config(), key="memory_board",
+        )
+    else:
+        game_html = generate_memory_game_html()
+        if _DEBUG:
+            _perf_count("payload_bytes", len(game_html.encode()))
+        components.html(game_html, height=layout["height"], scrolling=False)
 
 
 # --------------- Stage: Win ---------------
@@ -775,8 +1885,10 @@ def view_win():
     st.balloons()
     
     # Show final score/stats (German translation)
-    total_cards = len(st.session_state.deck)
+    total_cards = _deck_size()
     total_pairs = len(st.session_state.pairs)
+    stats = st.session_state.game_stats
+    moves = stats["moves"]
     
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -784,7 +1896,19 @@ def view_win():
     with col2:
         st.metric("Gefundene Paare", total_pairs)
     with col3:
-        st.metric("Erfolgsrate", "100%")
+        st.metric("Erfolgsrate", f"{stats['matches'] / moves:.0%}" if moves else "–")
+
+    # Only the component board reports moves; the fallback board has no stats
+    if moves:
+        seconds = stats["duration_ms"] // 1000
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Züge", moves)
+        with col2:
+            st.metric("Spieldauer", f"{seconds // 60}:{seconds % 60:02d}")
+        with col3:
+            mean_ms = stats["match_ms"] / max(1, stats["matches"])
+            st.metric("Ø Zeit bis zum Paar", f"{mean_ms / 1000:.1f} s")
     
     st.markdown("---")
     left, right = st.columns(2)
@@ -799,7 +1923,7 @@ def view_win():
 
     st.markdown("---")
     if st.button("🧰 Neu starten (neue Bilder)"):
-        for key in ["stage","back_img","faces","unpaired_ids","pair_bucket","pairs","deck","revealed","mismatch_pending"]:
+        for key in ["stage","back_img","back_key","faces","ingested","collapsed","unpaired_ids","pair_bucket","pairs","deck","revealed","mismatch_pending"]:
             if key in st.session_state:
                 del st.session_state[key]
         _init_state()
@@ -817,18 +1941,34 @@ def main():
     )
     
     _init_state()
+    _account_session()
+    if _DEBUG:
+        started = time.perf_counter()
+        st.session_state.setdefault("perf_session", f"{random.getrandbits(32):08x}")
+        st.session_state.perf = {"timings": {}, "counters": {}}
     stage = st.session_state.stage
-    if stage == "setup":
-        view_setup()
-    elif stage == "pair":
-        view_pair()
-    elif stage == "play":
-        view_play()
-    elif stage == "win":
-        view_win()
-    else:
-        st.session_state.stage = "setup"
-        view_setup()
+    if stage != "play":
+        # The board unmounts with the play page; its document is rebuilt on return
+        st.session_state.board_sent = set()
+        st.session_state.board_document = None
+    try:
+        if stage == "setup":
+            view_setup()
+        elif stage == "pair":
+            view_pair()
+        elif stage == "play":
+            view_play()
+        elif stage == "win":
+            view_win()
+        else:
+            st.session_state.stage = "setup"
+            view_setup()
+    finally:
+        # Logged even when a view cut the run short with a rerun
+        if _DEBUG:
+            record = _perf_finish(started, stage)
+    if _DEBUG:
+        _debug_panel(record)
 
 
 if __name__ == "__main__":
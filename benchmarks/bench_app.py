@@ -0,0 +1,287 @@
+'''Rerun latency, peak memory and payload size of the app across deck sizes.
+
+Drives app.py through Streamlit's AppTest with synthetic face sets and
+writes one JSON record per (faces, resolution) combination, so results of
+two versions can be diffed or compared by a script:
+
+    python benchmarks/bench_app.py --faces 4,32,128,512 --px 320,1280 --out bench.json
+
+Timings are the median of --repeat warm reruns; peak memory is measured
+separately with tracemalloc (Python and NumPy allocations) so it does not
+skew the timings. Blobs go to a throwaway MEMORY_BLOB_DIR unless one is set,
+and the memory budgets are lifted so no upload is turned away.
+
+All runs import the same ``app`` module, so they share its caches and (with
+MEMORY_IMAGE_DELIVERY=url) one image server; the report records the
+delivery mode that was actually in effect.
+'''
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("MEMORY_BLOB_DIR", tempfile.mkdtemp(prefix="memory_bench_"))
+os.environ.setdefault("MEMORY_SESSION_BUDGET_MB", "1048576")
+os.environ.setdefault("MEMORY_GLOBAL_BUDGET_MB", "1048576")
+sys.path.insert(0, REPO)
+
+import streamlit  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import app  # noqa: E402
+
+_TIMEOUT = 600
+
+
+def synthetic_faces(count, px, seed):
+    '''JPEG bytes of ``count`` distinct px x (3/4 px) images (gradient plus noise).'''
+    rng = np.random.default_rng(seed)
+    h, w = px * 3 // 4, px
+    yy, xx = np.mgrid[0:h, 0:w]
+    out = []
+    for _ in range(count):
+        base = rng.integers(0, 256, size=3)
+        slope = rng.uniform(-0.5, 0.5, size=(2, 3)) * 255 / px
+        pixels = base + yy[..., None] * slope[0] + xx[..., None] * slope[1] + rng.normal(0, 12, size=(h, w, 3))
+        buf = io.BytesIO()
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buf, "JPEG", quality=90)
+        out.append(buf.getvalue())
+    return out
+
+
+def _run_app(repo):
+    '''AppTest script: the app itself, imported so every run shares one module.'''
+    import sys
+
+    sys.path.insert(0, repo)
+    import app
+
+    app.main()
+
+
+def _check(at):
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return at
+
+
+def _click(at, label):
+    for button in at.button:
+        if label in button.label:
+            button.click()
+            return _check(at.run())
+    raise KeyError(label)
+
+
+def _timed_run(at):
+    t0 = time.perf_counter()
+    _check(at.run())
+    return time.perf_counter() - t0
+
+
+def _peak_run(at):
+    tracemalloc.start()
+    try:
+        _check(at.run())
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure_reruns(at, repeat):
+    '''First (already done by the caller) plus warm reruns of the current stage.'''
+    times = [_timed_run(at) for _ in range(repeat)]
+    return {"rerun_s": statistics.median(times), "rerun_max_s": max(times), "peak_bytes": _peak_run(at)}
+
+
+def _setup_probe(repo, images, repeat):
+    '''Runs inside AppTest: the setup page's upload path on fake uploads.
+
+    ``_sync_faces`` (reading, ingestion) and the duplicate check run once
+    cold, then ``repeat`` times warm as on a rerun with the same uploads.
+    '''
+    import io
+    import statistics
+    import sys
+    import time
+    import tracemalloc
+
+    import streamlit as st
+
+    sys.path.insert(0, repo)
+    import app
+
+    class Upload(io.BytesIO):
+        '''The parts of UploadedFile the app relies on.'''
+
+        def __init__(self, i, data):
+            super().__init__(data)
+            self.name = f"face_{i:04d}.jpg"
+            self.size = len(data)
+            self.file_id = f"bench-{i}"
+
+    def setup_run():
+        rejected = app._sync_faces(uploads)
+        app._duplicate_groups(st.session_state.faces)
+        return rejected
+
+    app._init_state()
+    app._account_session()
+    uploads = [Upload(i, data) for i, data in enumerate(images)]
+    t0 = time.perf_counter()
+    rejected = app._sync_faces(uploads)
+    ingest_s = time.perf_counter() - t0
+    if rejected:
+        raise RuntimeError(f"uploads rejected: {rejected}")
+    app._duplicate_groups(st.session_state.faces)
+    first_s = time.perf_counter() - t0
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        setup_run()
+        times.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    try:
+        setup_run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    st.session_state.bench = {
+        "ingest_s": ingest_s,
+        "setup": {"first_s": first_s, "rerun_s": statistics.median(times), "rerun_max_s": max(times), "peak_bytes": peak},
+        "faces": st.session_state.faces,
+    }
+
+
+def _probe(repo, state):
+    '''Runs inside AppTest: times start_game and sizes the board payloads.'''
+    import json
+    import sys
+    import time
+
+    import streamlit as st
+
+    sys.path.insert(0, repo)
+    import app
+
+    app._init_state()
+    for key, value in state.items():
+        st.session_state[key] = value
+    t0 = time.perf_counter()
+    app.start_game(seed=1)
+    start_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    html = app.generate_memory_game_html()
+    html_s = time.perf_counter() - t0
+    st.session_state.bench = {
+        "start_game_s": start_s,
+        "html_s": html_s,
+        "html_bytes": len(html.encode()),
+        "board_args_bytes": len(json.dumps(app._board_data()).encode()),
+        "image_delivery": app._image_delivery(),
+    }
+
+
+def bench_case(n_faces, px, repeat, seed):
+    images = synthetic_faces(n_faces + 1, px, seed)
+    _, back = app._ingest_image(images[0])
+    record = {
+        "faces": n_faces,
+        "px": px,
+        "image_bytes": sum(len(b) for b in images[1:]),
+    }
+
+    setup = AppTest.from_function(_setup_probe, args=(REPO, images[1:], repeat), default_timeout=_TIMEOUT)
+    _check(setup.run())
+    bench = setup.session_state["bench"]
+    faces = bench.pop("faces")
+    record.update(bench)
+    ids = [f["id"] for f in faces]
+    pairs = [[ids[i], ids[i + 1] if i + 1 < len(ids) else ids[i]] for i in range(0, len(ids), 2)]
+
+    at = AppTest.from_function(_run_app, args=(REPO,), default_timeout=_TIMEOUT)
+    _check(at.run())
+    at.session_state["back_img"] = back
+    at.session_state["faces"] = faces
+
+    # Worst case for the pairing page: nothing paired yet
+    at.session_state["unpaired_ids"] = set(ids)
+    at.session_state["stage"] = "pair"
+    record["pair"] = {"first_s": _timed_run(at), **measure_reruns(at, repeat)}
+
+    at.session_state["pairs"] = pairs
+    at.session_state["unpaired_ids"] = set()
+    _check(at.run())
+    t0 = time.perf_counter()
+    _click(at, "Spiel starten")
+    record["play"] = {"first_s": time.perf_counter() - t0, **measure_reruns(at, repeat)}
+
+    probe = AppTest.from_function(
+        _probe, args=(REPO, {"back_img": back, "faces": faces, "pairs": pairs}), default_timeout=_TIMEOUT
+    )
+    _check(probe.run())
+    record.update(probe.session_state["bench"])
+    return record
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--faces", default="4,32,128,512", help="comma-separated face counts")
+    parser.add_argument("--px", default="320,1280", help="comma-separated source image widths")
+    parser.add_argument("--repeat", type=int, default=3, help="warm reruns per stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    results = []
+    for px in map(int, args.px.split(",")):
+        for n_faces in map(int, args.faces.split(",")):
+            record = bench_case(n_faces, px, args.repeat, args.seed + n_faces * 7919 + px)
+            results.append(record)
+            print(
+                f"{n_faces:4d} faces @ {px:4d}px: ingest {record['ingest_s']:.2f}s, "
+                f"pair rerun {record['pair']['rerun_s'] * 1000:.0f}ms, "
+                f"play rerun {record['play']['rerun_s'] * 1000:.0f}ms, html {record['html_bytes'] / 1024:.0f} KiB",
+                file=sys.stderr,
+            )
+
+    report = {
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "streamlit": streamlit.__version__,
+        "image_delivery": app._image_delivery(),
+        "components": app._USE_COMPONENTS,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()